@@ -1,9 +1,9 @@
-from langchain_community.vectorstores import FAISS
 from langchain.prompts import PromptTemplate
 import os
+from pathlib import Path
 import google.generativeai as genai
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.chains.question_answering import load_qa_chain
 import pandas as pd
 from langchain.retrievers.multi_query import MultiQueryRetriever
@@ -11,7 +11,38 @@ from pdf2image import convert_from_path
 import streamlit as st
 import pytesseract
 
-import fitz  # PyMuPDF
+from langchain.docstore.document import Document
+from main import get_embeddings
+from incremental_index import update_index, content_hash
+from bulk_embed import DEFAULT_CONCURRENCY, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from pdf_text import extract_pages
+from question_neighbors import compute_neighbors, save_neighbors, DEFAULT_NEIGHBORS
+from chunking import chunk_documents, chunk_stats, save_chunk_stats, DEFAULT_TARGET_TOKENS, DEFAULT_OVERLAP_TOKENS
+
+def extract_pdf_documents(pdf_path):
+    """
+    Extracts the pages of a PDF file as Documents with structured metadata.
+    Pages without a usable text layer are OCRed (see `pdf_text.extract_pages`).
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+
+    Returns:
+        list: One Document per page. The page content keeps the 'Book: ..., Page Number - N'
+        prefix, and the metadata holds 'book', 'page', 'source' and 'extraction'.
+    """
+    # The book name is the file name without directory and '.pdf', as in BOOKS and the image manifest
+    book_name = Path(pdf_path).stem
+    documents = []
+
+    # Read each page from the text layer, OCRing only pages without usable text
+    for page in extract_pages(pdf_path):
+        # Format the extracted text with page number and book name
+        formatted_text = f"""Book: {book_name}, Page Number - {page.page_number}, {page.text.strip()}"""
+        metadata = {"book": book_name, "page": page.page_number, "source": pdf_path, "extraction": page.method}
+        documents.append(Document(page_content=formatted_text, metadata=metadata))
+
+    return documents
 
 def extract_pdf_text(pdf_path):
     """
@@ -23,37 +54,75 @@ def extract_pdf_text(pdf_path):
     Returns:
         list: A list of formatted strings containing the book name, page number, and text.
     """
-    # Extract the book name from the PDF file path (removing the '.pdf' extension)
-    book_name = pdf_path.replace('.pdf', '')
-    
-    # Open the PDF file
-    pdf_document = fitz.open(pdf_path)
-    extracted_text = []
+    return [document.page_content for document in extract_pdf_documents(pdf_path)]
 
-    # Iterate through each page in the PDF
-    for page_num in range(len(pdf_document)):
-        # Load the page
-        page = pdf_document.load_page(page_num)
 
-        # Extract text from the page
-        text = page.get_text("text")
 
-        # Format the extracted text with page number and book name
-        formatted_text = f"""Book: {book_name}, Page Number - {page_num + 1}, {text.strip()}"""
-        extracted_text.append(formatted_text)
+def create_book_index(pdf_files, index_dir, target_tokens=DEFAULT_TARGET_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+                      index_type="flat", index_params=None, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                      tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Builds or incrementally updates a book index from one or more PDF files.
+
+    Pages are split into chunks of about `target_tokens` tokens that never cross a page
+    boundary (see `chunking.chunk_documents`). Every chunk is stored under the id
+    '<book name>#<page number>#<chunk>', so a rebuild only re-embeds chunks whose text
+    changed and drops those that no longer exist. Book, page and source are stored as
+    metadata, so one combined index can serve per-book queries and the per-book
+    FAISS_INDEX_* directories are no longer needed. Chunk-size statistics are saved
+    to chunk_stats.json in the index directory.
 
-    return extracted_text
+    Args:
+        pdf_files (list): Paths to the PDF files to index.
+        index_dir (str): Directory of the FAISS index, e.g. 'FAISS_INDEX_ALL_BOOKS'.
+        target_tokens (int): Token budget per chunk.
+        overlap_tokens (int): Tokens shared between consecutive chunks of a page.
+        index_type (str): 'flat', 'hnsw', 'ivf' or 'ivfpq' (see `ann_index`).
+        index_params (dict): Parameters for the approximate index types.
+        requests_per_minute (float): Embedding request budget of the build.
+        tokens_per_minute (float): Embedding token budget of the build.
+        concurrency (int): Maximum number of embedding calls in flight.
 
+    Returns:
+        FAISS: The updated vector store.
+    """
+    documents = []
+    for pdf_file in pdf_files:
+        documents.extend(extract_pdf_documents(pdf_file))
+    chunks = chunk_documents(documents, target_tokens, overlap_tokens)
+    texts = [chunk.page_content for chunk in chunks]
+    ids = [f"{chunk.metadata['book']}#{chunk.metadata['page']}#{chunk.metadata['chunk']}" for chunk in chunks]
+    metadatas = [chunk.metadata for chunk in chunks]
+    vector_store, _ = update_index(index_dir, texts, get_embeddings(), ids=ids, metadatas=metadatas,
+                                   index_type=index_type, index_params=index_params,
+                                   requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                                   concurrency=concurrency)
+    stats = chunk_stats(chunks)
+    save_chunk_stats(index_dir, stats, target_tokens, overlap_tokens)
+    print(f"Chunk statistics for {index_dir}: {stats}")
+    return vector_store
 
 
-def create_question_embeddings_from_excel(excel_path, sheet_name='Sheet1'):
+def create_question_embeddings_from_excel(excel_path, sheet_name='Sheet1', index_type="flat", index_params=None,
+                                          neighbors_k=DEFAULT_NEIGHBORS, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                                          tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, concurrency=DEFAULT_CONCURRENCY):
     """
     Reads an Excel file, creates embeddings of each question from the 2nd row onwards,
     and saves the embeddings in a FAISS vector database.
 
+    The `neighbors_k` most similar other questions of every question are computed in
+    one batched all-pairs search and saved to neighbors.json in the index directory,
+    so the app can suggest similar questions for a known question without a search.
+
     Args:
         excel_path (str): Path to the Excel file.
         sheet_name (str): The name of the sheet in the Excel file to read. Default is 'Sheet1'.
+        index_type (str): 'flat', 'hnsw', 'ivf' or 'ivfpq' (see `ann_index`).
+        index_params (dict): Parameters for the approximate index types.
+        neighbors_k (int): Number of similar questions saved per question.
+        requests_per_minute (float): Embedding request budget of the build.
+        tokens_per_minute (float): Embedding token budget of the build.
+        concurrency (int): Maximum number of embedding calls in flight.
 
     Returns:
         FAISS: The FAISS vector store with question embeddings.
@@ -64,20 +133,21 @@ def create_question_embeddings_from_excel(excel_path, sheet_name='Sheet1'):
     # Assuming the first column contains the questions
     questions = df.iloc[1:, 0].tolist()  # Skip the first row (header) and get questions from the first column
 
-    # Initialize the embeddings model
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+    # Initialize the embeddings model (cached, so questions seen before are not re-embedded)
+    embeddings = get_embeddings()
 
-    # Create embeddings for each question in batches
-    question_embeddings = []
-    batch_size = 100
-    for i in range(0, len(questions), batch_size):
-        batch = questions[i:i + batch_size]
-        batch_embeddings = embeddings.embed_documents(batch)
-        question_embeddings.extend(zip(batch, batch_embeddings))
+    # Embed only questions that are new since the last build; removed ones are deleted
+    ids = [f"question#{content_hash(str(question))}" for question in questions]
+    unique = dict(zip(ids, map(str, questions)))
+    vector_store, _ = update_index("FAISS_INDEX_Questions", list(unique.values()), embeddings, ids=list(unique),
+                                   index_type=index_type, index_params=index_params,
+                                   requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                                   concurrency=concurrency)
 
-    # Save the embeddings to a FAISS vector store
-    vector_store = FAISS.from_embeddings(question_embeddings, embedding=embeddings)
-    vector_store.save_local("FAISS_INDEX_Questions")
+    # The vectors come from the embedding cache filled by the build above
+    texts = list(unique.values())
+    neighbors = compute_neighbors(texts, embeddings.embed_documents(texts), k=neighbors_k)
+    save_neighbors("FAISS_INDEX_Questions", neighbors, neighbors_k)
 
     return vector_store
 
@@ -94,9 +164,10 @@ def create_question_embeddings_from_excel(excel_path, sheet_name='Sheet1'):
 #     print("\n" + "-" * 50 + "\n")  # Just for separation between pages
 
 # print(len(extracted_text_list))
-genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
+# The environment variable lets offline tools (benchmarks) run without a secrets file
+genai.configure(api_key=os.environ.get("GOOGLE_API_KEY") or st.secrets["GOOGLE_API_KEY"])
 
-# embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+# embeddings = get_embeddings()
 # text_embeddings = []
 # batch_size = 100 
 # text_chunks = extracted_text_list
@@ -107,4 +178,5 @@ genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
 
 # vector_store = FAISS.from_embeddings(text_embeddings, embedding=embeddings)
 # vector_store.save_local("FAISS_INDEX_The_Soft_Skills_Book")
+# create_book_index(pdf_files, "FAISS_INDEX_ALL_BOOKS")  # Incremental: only changed pages are re-embedded
 create_question_embeddings_from_excel('Questions_Dan_White.xlsx')
\ No newline at end of file
@@ -0,0 +1,205 @@
+import argparse
+import json
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+from lazy_index import index_files
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+
+def default_params(index_type, num_vectors, dimension):
+    """
+    Returns sensible parameters for an index type and corpus size.
+    """
+    nlist = max(1, min(int(math.sqrt(num_vectors)), num_vectors // 39 or 1))
+    if index_type == "hnsw":
+        return {"M": 32, "efConstruction": 80, "efSearch": 64}
+    if index_type == "ivf":
+        return {"nlist": nlist, "nprobe": min(8, nlist)}
+    if index_type == "ivfpq":
+        m = next(m for m in (16, 8, 4, 2, 1) if dimension % m == 0)
+        nbits = max(1, min(8, int(math.log2(max(2, num_vectors // 4)))))
+        return {"nlist": nlist, "nprobe": min(8, nlist), "m": m, "nbits": nbits}
+    return {}
+
+
+def build_faiss_index(vectors, index_type="flat", metric=faiss.METRIC_L2, **params):
+    """
+    Builds and trains a FAISS index over `vectors`.
+
+    Args:
+        vectors (np.ndarray): float32 matrix of shape (n, d).
+        index_type (str): One of 'flat', 'hnsw', 'ivf' or 'ivfpq'.
+        metric (int): faiss.METRIC_L2 or faiss.METRIC_INNER_PRODUCT.
+        **params: Overrides for `default_params` (M, efConstruction, efSearch, nlist, nprobe, m, nbits).
+
+    Returns:
+        faiss.Index: The index with every vector added, in order.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dimension = vectors.shape
+    params = dict(default_params(index_type, num_vectors, dimension), **params)
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dimension) if metric == faiss.METRIC_INNER_PRODUCT else faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["M"], metric)
+        index.hnsw.efConstruction = params["efConstruction"]
+        index.hnsw.efSearch = params["efSearch"]
+    elif index_type in ("ivf", "ivfpq"):
+        quantizer = faiss.IndexFlatIP(dimension) if metric == faiss.METRIC_INNER_PRODUCT else faiss.IndexFlatL2(dimension)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, params["nlist"], metric)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, params["nlist"], params["m"], params["nbits"], metric)
+        index.train(vectors)
+        index.nprobe = params["nprobe"]
+    else:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    index.add(vectors)
+    return index
+
+
+def store_vectors(store):
+    """
+    Returns the exact vectors of a flat LangChain FAISS store, in position order.
+    """
+    return store.index.reconstruct_n(0, store.index.ntotal)
+
+
+def convert_store(store, index_type, **params):
+    """
+    Returns a copy of a flat LangChain FAISS store backed by an ANN index of `index_type`.
+
+    The docstore and position -> id mapping are shared, since vectors keep their order.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    index = build_faiss_index(store_vectors(store), index_type, store.index.metric_type, **params)
+    return FAISS(
+        store.embedding_function,
+        index,
+        store.docstore,
+        store.index_to_docstore_id,
+        normalize_L2=store._normalize_L2,
+        distance_strategy=store.distance_strategy,
+    )
+
+
+def search_parameters(index, selector=None):
+    """
+    Returns FAISS search parameters carrying `selector` that match the index type, so
+    filtered searches keep the index's own nprobe / efSearch.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+# === Benchmark ===
+
+def parse_config(value):
+    """
+    Parses 'hnsw:M=32,efSearch=64' into ('hnsw', {'M': 32, 'efSearch': 64}).
+    """
+    index_type, _, options = value.partition(":")
+    params = {}
+    for option in filter(None, options.split(",")):
+        key, _, number = option.partition("=")
+        params[key] = int(number)
+    return index_type, params
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def benchmark(index_dir, configs=None, k=5, num_queries=200, noise=0.01, seed=0):
+    """
+    Compares index configurations against the exact flat index saved in `index_dir`.
+
+    Queries are stored vectors perturbed with Gaussian noise, so no embedding call is
+    needed. For every configuration this reports build time, recall@k against the flat
+    baseline, single-query latency percentiles and serialized index size.
+
+    Args:
+        index_dir (str): A FAISS_INDEX_* directory saved by `lazy_index.save_lazy`.
+        configs (list): (index_type, params) tuples. Defaults to one of each type.
+        k (int): Number of neighbors.
+        num_queries (int): Number of queries.
+        noise (float): Standard deviation of the noise, relative to the vectors' mean norm.
+        seed (int): Random seed.
+
+    Returns:
+        list: One result dict per configuration.
+    """
+    flat = faiss.read_index(index_files(index_dir)[0])
+    if not isinstance(flat, faiss.IndexFlat):
+        raise ValueError(f"{index_dir} is not a flat index; benchmark against a flat build")
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(vectors), size=num_queries)
+    scale = noise * float(np.linalg.norm(vectors, axis=1).mean())
+    queries = (vectors[picks] + rng.normal(0, scale, size=(num_queries, vectors.shape[1]))).astype(np.float32)
+    k = min(k, len(vectors))
+    _, truth = flat.search(queries, k)
+
+    configs = configs or [(index_type, {}) for index_type in INDEX_TYPES]
+    results = []
+    for index_type, params in configs:
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, index_type, flat.metric_type, **params)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        found = np.empty_like(truth)
+        for i in range(num_queries):
+            start = time.perf_counter()
+            _, found[i:i + 1] = index.search(queries[i:i + 1], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(num_queries)])
+        results.append({
+            "index_type": index_type,
+            "params": dict(default_params(index_type, len(vectors), vectors.shape[1]), **params),
+            "build_seconds": round(build_seconds, 4),
+            f"recall@{k}": round(float(recall), 4),
+            "p50_ms": round(percentile(latencies, 50), 4),
+            "p95_ms": round(percentile(latencies, 95), 4),
+            "p99_ms": round(percentile(latencies, 99), 4),
+            "memory_bytes": int(faiss.serialize_index(index).nbytes),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ANN index types against the flat baseline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("benchmark")
+    bench.add_argument("index_dirs", nargs="+", help="FAISS_INDEX_* directories to benchmark.")
+    bench.add_argument("--config", action="append", type=parse_config,
+                       help="Index configuration, e.g. 'hnsw:M=32,efSearch=64'. Repeatable.")
+    bench.add_argument("--k", type=int, default=5)
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    all_results = {}
+    for index_dir in args.index_dirs:
+        all_results[index_dir] = benchmark(index_dir, args.config, k=args.k, num_queries=args.queries)
+        print(f"\n{index_dir}")
+        for result in all_results[index_dir]:
+            print(json.dumps(result))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(all_results, f, indent=1)
@@ -0,0 +1,206 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+
+import numpy as np
+from langchain.docstore.document import Document
+
+
+@dataclass
+class CachedAnswer:
+    """
+    An answer served from the cache.
+
+    Attributes:
+        question (str): The cached question that matched.
+        answer (str): The generated answer text.
+        docs (list): Retrieved pages the answer was generated from.
+        suggested_questions (list): Suggested questions shown with the answer.
+        distance (float): Cosine distance between the new and the cached question.
+    """
+    question: str
+    answer: str
+    docs: list
+    suggested_questions: list
+    distance: float
+
+
+def dump_documents(docs):
+    return json.dumps([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs])
+
+
+def load_documents(data):
+    return [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in json.loads(data)]
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    """
+    Semantic answer cache shared by every worker process through one SQLite file.
+
+    Entries are keyed on the book selection plus the question embedding. A lookup
+    returns the closest cached answer for the same selection when its cosine distance
+    to the new question is within `max_distance`. Entries expire after `ttl_seconds`
+    and the least recently used ones are evicted beyond `max_entries`.
+
+    Each process keeps the embeddings of every selection it has looked up as one
+    in-memory matrix and only reads rows added since (ids only grow), so a lookup is a
+    single matrix-vector product. Rows evicted by any process are dropped from the
+    matrix when they come up as the best match, and the matrix is rebuilt from SQLite
+    once it holds twice `max_entries` rows.
+    """
+
+    def __init__(self, path, max_distance=0.05, ttl_seconds=7 * 24 * 3600, max_entries=5000):
+        self.path = path
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._matrices = {}
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS answers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    selection TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    answer TEXT NOT NULL,
+                    docs TEXT NOT NULL,
+                    suggested_questions TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_selection ON answers (selection)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _count(self, conn, name):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def _sync(self, conn, selection):
+        """
+        Returns the in-memory matrix of `selection` after appending the rows stored since
+        the last call, by this or any other process.
+        """
+        entry = self._matrices.get(selection)
+        if entry is None or entry["size"] > 2 * self.max_entries:
+            entry = {"ids": np.zeros(0, dtype=np.int64), "created": np.zeros(0), "matrix": None, "size": 0, "last_id": 0}
+            self._matrices[selection] = entry
+        rows = conn.execute(
+            "SELECT id, embedding, created_at FROM answers WHERE selection = ? AND id > ? ORDER BY id",
+            (selection, entry["last_id"]),
+        ).fetchall()
+        if not rows:
+            return entry
+
+        vectors = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        size, needed = entry["size"], entry["size"] + len(rows)
+        if entry["matrix"] is None or needed > len(entry["matrix"]):
+            # Grow by doubling so appending one row does not copy the whole matrix
+            capacity = max(needed, 2 * len(entry["ids"]), 64)
+            matrix = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            ids = np.zeros(capacity, dtype=np.int64)
+            created = np.full(capacity, -np.inf)
+            if size:
+                matrix[:size], ids[:size], created[:size] = entry["matrix"][:size], entry["ids"][:size], entry["created"][:size]
+            entry["matrix"], entry["ids"], entry["created"] = matrix, ids, created
+        entry["matrix"][size:needed] = vectors
+        entry["ids"][size:needed] = [row[0] for row in rows]
+        entry["created"][size:needed] = [row[2] for row in rows]
+        entry["size"] = needed
+        entry["last_id"] = rows[-1][0]
+        return entry
+
+    def lookup(self, selection, query_vector):
+        """
+        Returns the cached answer closest to `query_vector` for `selection`, or None.
+
+        Args:
+            selection (str): Key of the book selection (and retrieval settings) the answer belongs to.
+            query_vector (list): Embedding of the new question.
+
+        Returns:
+            CachedAnswer: The matching entry, or None on a miss.
+        """
+        query = _normalize(query_vector)
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn, conn:
+            entry = self._sync(conn, selection)
+            size = entry["size"]
+            if size:
+                distances = 1.0 - entry["matrix"][:size] @ query
+                distances[entry["created"][:size] < now - self.ttl_seconds] = np.inf
+            while size:
+                position = int(np.argmin(distances))
+                best_distance = float(distances[position])
+                if best_distance > self.max_distance:
+                    break
+                best_id = int(entry["ids"][position])
+                row = conn.execute(
+                    "SELECT question, answer, docs, suggested_questions FROM answers WHERE id = ?", (best_id,)
+                ).fetchone()
+                if row is None:
+                    # Evicted since it was read; never consider it again
+                    entry["created"][position] = -np.inf
+                    distances[position] = np.inf
+                    continue
+                self._count(conn, "hits")
+                conn.execute("UPDATE answers SET last_used_at = ? WHERE id = ?", (now, best_id))
+                question, answer, docs, suggested = row
+                return CachedAnswer(question, answer, load_documents(docs), load_documents(suggested), best_distance)
+
+            self._count(conn, "misses")
+            return None
+
+    def store(self, selection, question, query_vector, answer, docs, suggested_questions):
+        """
+        Stores a generated answer and evicts expired and least recently used entries.
+        """
+        now = time.time()
+        embedding = _normalize(query_vector).tobytes()
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                """INSERT INTO answers
+                   (selection, question, embedding, answer, docs, suggested_questions, created_at, last_used_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (selection, question, embedding, answer, dump_documents(docs),
+                 dump_documents(suggested_questions), now, now),
+            )
+            conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                """DELETE FROM answers WHERE id IN (
+                       SELECT id FROM answers ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)""",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        """
+        Returns the shared hit/miss counters and the number of stored entries.
+        """
+        with closing(self._connect()) as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0), "entries": entries}
+
+    def clear(self):
+        """
+        Removes every cached answer. Counters are kept.
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM answers")
+            self._matrices.clear()
@@ -1,17 +1,21 @@
 import streamlit as st
 import pandas as pd
-from main import user_input1, user_input2 , user_input3, user_input4 , user_input
+from main import stream_user_input, BOOKS, POPULAR_QUESTIONS
 from io import BytesIO
-from PIL import Image , UnidentifiedImageError
+from PIL import UnidentifiedImageError
 import requests
 # from trial import translate
 import re
 # from Levenshtein import distance as levenshtein_distance
-import os
-import Levenshtein
+from page_lookup import get_page_lookup
+from page_images import get_display_image
+from user_directory import get_user_directory
 # Define the maximum number of free queries
 QUERY_LIMIT = 100
 
+# Allowed users: user.xlsx, or a .csv / .sqlite export for large user lists
+USER_SOURCE = 'user.xlsx'
+
 # Initialize session state for tracking the number of queries, conversation history, suggested questions, and authentication
 if 'query_count' not in st.session_state:
     st.session_state.query_count = 0
@@ -31,6 +35,9 @@ if 'generate_response' not in st.session_state:
 if 'chat' not in st.session_state:
     st.session_state.chat = ""
 
+if 'last_timing' not in st.session_state:
+    st.session_state.last_timing = None
+
 
 def extract_book_name_from_text(docs):
     """
@@ -42,6 +49,12 @@ def extract_book_name_from_text(docs):
     Returns:
         str: The extracted book name if found, otherwise None.
     """
+    if not docs:
+        # Nothing was retrieved (e.g. BM25-only fallback with no matching term)
+        return None
+    if docs[0].metadata.get('book'):
+        return docs[0].metadata['book']
+    # Indexes built before metadata was stored only have the book name in the text
     text = docs[0].page_content
     # Regular expression pattern to match "Book: <Book Name>," where <Book Name> is the book name
     pattern = r"Book:\s*(.+?)\s*,\s*Page Number"
@@ -57,6 +70,10 @@ def extract_book_name_from_text(docs):
     return None
 
 def extract_page_number_from_document(doc):
+    if not doc:
+        return None
+    if doc[0].metadata.get('page') is not None:
+        return int(doc[0].metadata['page'])
     # Access the page content from the Document object
     text = doc[0].page_content
     
@@ -77,6 +94,7 @@ def extract_relevant_page_number(question, excel_sheet):
     """
     Extracts the most relevant page number from the Excel sheet based on the similarity 
     between the user's question and the text entries in the sheet using Levenshtein distance.
+    See `page_lookup.PageLookupIndex` for how the search is narrowed.
 
     Parameters:
     - question (str): The user's question.
@@ -87,46 +105,8 @@ def extract_relevant_page_number(question, excel_sheet):
       Returns None if no match is found.
     """
     try:
-        # Load the Excel sheet into a DataFrame
-        # If your Excel sheet has headers, pandas will automatically detect them.
-        # If not, set header=None and assign column names manually.
-        df = pd.read_excel(excel_sheet)
-        
-        # Check if the DataFrame has headers 'Text' and 'Page Number'
-        if 'Text' in df.columns and 'Page Number' in df.columns:
-            text_column = 'Text'
-            page_number_column = 'Page Number'
-        else:
-            # If there are no headers, assume first column is text and second is page number
-            df = pd.read_excel(excel_sheet, header=None)
-            df.columns = ['Text', 'Page Number']
-            text_column = 'Text'
-            page_number_column = 'Page Number'
-        
-        # Initialize variables to keep track of the best match
-        most_relevant_page = None
-        highest_similarity = -1  # Initialize to -1 since similarity ranges from 0 to 1
-
-        # Normalize the question for better comparison
-        normalized_question = question.strip().lower()
-
-        # Iterate through each row in the Excel sheet
-        for index, row in df.iterrows():
-            text = str(row[text_column]).strip().lower()  # Ensure text is string and normalized
-            page_number = row[page_number_column]
-
-            # Compute the Levenshtein distance
-            distance = Levenshtein.distance(normalized_question, text)
-            
-            # Compute similarity as 1 / (1 + distance) to convert distance to similarity score between 0 and 1
-            similarity = 1 / (1 + distance)
-
-            # Update the most relevant page if this similarity is higher than previous ones
-            if similarity > highest_similarity:
-                highest_similarity = similarity
-                most_relevant_page = page_number
-
-        return most_relevant_page
+        # The sheet is parsed and indexed once per process and reloaded only when it changes
+        return get_page_lookup(excel_sheet).lookup(question)
 
     except FileNotFoundError:
         print(f"Error: The file '{excel_sheet}' was not found.")
@@ -147,17 +127,8 @@ def clean_text(text):
     return text
 
 def authenticate_user(email):
-    # Load the Excel file
-    df = pd.read_excel('user.xlsx')
-    # Convert the input email to lowercase
-    email = email.lower()
-    # Convert the emails in the dataframe to lowercase
-    df['Email'] = df['Email'].str.lower()
-    # Check if the email matches any entry in the file
-    user = df[df['Email'] == email]
-    if not user.empty:
-        return True
-    return False
+    # Look the email up in the in-memory user set (loaded once, refreshed when the file changes)
+    return get_user_directory(USER_SOURCE).contains(email)
 
 # def get_image_link(article_link, file_path='Linkidin_blogs.xlsx'):
 #     # Load the Excel file
@@ -237,15 +208,8 @@ def create_ui():
 
     st.sidebar.markdown("<h5 style='color: #08daff;'>Popular Questions</h3>", unsafe_allow_html=True)
 
-    suggested_questions = [
-        "What is Branding ?",
-        "How does a brand grows ?",
-        "Who is responsible for branding ?",
-        "What is the impact of brand building on demand curve ?",
-        "Explain Brand Value Growth Matrix ."
-    ]
-
-    for i, question in enumerate(suggested_questions):
+    # Answers to these are precomputed (see precomputed_answers.py), so a click is served instantly
+    for i, question in enumerate(POPULAR_QUESTIONS):
         if st.sidebar.button(question, key=f"button_{i}", use_container_width=True):
             st.session_state.suggested_question = question
             st.session_state.generate_response = True
@@ -312,22 +276,10 @@ def create_ui():
             # st.subheader('Translated Text')
             # st.write( translated_text + "\n\n" + translate("For more details, please visit", from_lang='en', to_lang=LANGUAGES[target_language]) + ": " + post_link)
             if most_relevant_page is not None:
-                # Construct the image filename based on the most relevant page number
-                image_filename = f"{book_name}_page_{most_relevant_page}_image_1.png"
-                # converted_images\The Smart Branding Book_page_1_image_1.png
-                # Define the path to the image folder
-                image_folder = 'converted_images'
-
-                # Create the full path to the image
-                image_path = os.path.join(image_folder, image_filename)
-
-                # Check if the image file exists
-                if os.path.exists(image_path):
-                    # Open and display the image using PIL
-                    image = Image.open(image_path)
-                    st.image(image, use_column_width=True)
-                else:
-                    print(f"Image for page {most_relevant_page} not found at {image_path}")
+                # Pages with images are known from the manifest; the image is a cached, resized JPEG
+                image_bytes = get_display_image(book_name, most_relevant_page)
+                if image_bytes is not None:
+                    st.image(image_bytes, use_column_width=True)
             else:
                 print("Most relevant page not found")
             st.write("Explore Similiar questions :")
@@ -338,6 +290,15 @@ def create_ui():
                         st.session_state.suggested_question = suggested_question.page_content
                         st.session_state.generate_response = True
 
+    # Placeholder where a new answer is streamed before it joins the conversation history
+    live_answer = st.container()
+
+    if st.session_state.last_timing and st.session_state.last_timing['time_to_first_token'] is not None:
+        st.sidebar.caption(
+            f"Last answer: first token in {st.session_state.last_timing['time_to_first_token']:.2f}s, "
+            f"complete in {st.session_state.last_timing['total_seconds']:.2f}s"
+        )
+
     # Get user input at the bottom
     st.markdown("---")
     instr = "Ask a question:"
@@ -350,13 +311,12 @@ def create_ui():
                 question = st.text_input(instr, key="input_question", placeholder=instr, label_visibility='collapsed')
     
         # Add checkboxes horizontally
+        book_names = list(BOOKS)
         col_checkbox1, col_checkbox2 = st.columns(2)
-        with col_checkbox1:
-            checkbox1 = st.checkbox(label='Chat with The Smart Branding Book')
-            checkbox2 = st.checkbox(label='Chat with The Smart Marketing Book')
-        with col_checkbox2:
-            checkbox3 = st.checkbox(label='Chat with The Smart Advertising Book')
-            checkbox4 = st.checkbox(label='Chat with The Soft Skills Book')
+        selected = {}
+        for i, book_name in enumerate(book_names):
+            with (col_checkbox1 if i < len(book_names) / 2 else col_checkbox2):
+                selected[book_name] = st.checkbox(label=f'Chat with {book_name}')
     
         # Submit button
         submit_button = st.form_submit_button(label="Submit")
@@ -366,30 +326,33 @@ def create_ui():
             if st.session_state.query_count >= QUERY_LIMIT:
                 st.warning("You have reached the limit of free queries. Please consider our pricing options for further use.")
             else:
-                with st.spinner("Generating response..."):
-                    if checkbox1:
-                        response, docs , suggested_questions = user_input1(question)
-                    elif checkbox2:
-                        response, docs , suggested_questions = user_input2(question)
-                    elif checkbox3:
-                        response, docs, suggested_questions = user_input3(question)
-                    elif checkbox4:
-                        response, docs, suggested_questions = user_input4(question)
-                    else:
-                        # response, docs = None, None  # No checkbox selected
-                        response , docs , suggested_questions = user_input(question)
-    
-                    if response:
-                        most_relevant_page = extract_page_number_from_document(docs)
-                        book_name = extract_book_name_from_text(docs)
-                        print(docs)
-                        output_text = response.get('output_text', 'No response')  # Extract the 'output_text' from the response
-                        st.session_state.chat += str(output_text)
-                        st.session_state.conversation_history.append((question, output_text, most_relevant_page, book_name , suggested_questions))
-                        st.session_state.suggested_question = ""  # Reset the suggested question after submission
-                        st.session_state.query_count += 1  # Increment the query count
-                        st.session_state.generate_response = False
-                        st.rerun()
+                with st.spinner("Searching the books..."):
+                    # Every checked book is searched; with no book checked all books are searched
+                    books = [name for name in book_names if selected[name]]
+                    answer_stream , docs , suggested_questions = stream_user_input(question, books=books)
+
+                with live_answer:
+                    st.markdown(f"<p style='text-align: right; color: #484f4f;'><b>{question}</b></p>", unsafe_allow_html=True)
+                    col1, col2 = st.columns([1, 8])
+                    with col1:
+                        st.image('download.png', width=30)
+                    with col2:
+                        st.write_stream(answer_stream)
+
+                most_relevant_page = extract_page_number_from_document(docs)
+                book_name = extract_book_name_from_text(docs)
+                print(docs)
+                output_text = answer_stream.text or 'No response'
+                st.session_state.last_timing = {
+                    'time_to_first_token': answer_stream.time_to_first_token,
+                    'total_seconds': answer_stream.total_seconds,
+                }
+                st.session_state.chat += str(output_text)
+                st.session_state.conversation_history.append((question, output_text, most_relevant_page, book_name , suggested_questions))
+                st.session_state.suggested_question = ""  # Reset the suggested question after submission
+                st.session_state.query_count += 1  # Increment the query count
+                st.session_state.generate_response = False
+                st.rerun()
 
 
 
@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from main import (
+    BOOKS, answer_cache, answer_from_docs, cache_selection, embed_questions, normalize_books, retrieve_many,
+)
+from rate_limit import TokenBucket
+
+DEFAULT_OUTPUT = "batch_answers.jsonl"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_MINUTE = 60
+EMBED_BATCH_SIZE = 100
+
+
+def read_questions(path, sheet_name="Sheet1", skip_rows=1):
+    """
+    Reads the questions from the first column of a sheet (.xlsx) or a CSV file.
+
+    Like `create_question_embeddings_from_excel`, the first data row is skipped by
+    default. Empty cells and repeated questions are dropped, keeping the sheet order.
+    """
+    if path.endswith(".csv"):
+        df = pd.read_csv(path)
+    else:
+        df = pd.read_excel(path, sheet_name=sheet_name)
+    questions = [str(question).strip() for question in df.iloc[skip_rows:, 0].dropna()]
+    return list(dict.fromkeys(question for question in questions if question))
+
+
+def load_done(output_path):
+    """
+    Returns the (selection, question) pairs already answered in a results file.
+    A truncated last line (from an interrupted run) is ignored.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done.add((record["selection"], record["question"]))
+    return done
+
+
+def _pages(docs):
+    return [{"book": doc.metadata.get("book"), "page": doc.metadata.get("page")} for doc in docs]
+
+
+def run_batch(questions, output_path=DEFAULT_OUTPUT, books=None, k=None, concurrency=DEFAULT_CONCURRENCY,
+              requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, resume=True):
+    """
+    Answers a list of questions and appends one JSON line per answer to `output_path`.
+
+    Stages:
+        1. embed: all questions are embedded in batches of EMBED_BATCH_SIZE.
+        2. search: every index is searched once with the matrix of question vectors.
+        3. generate: answers are generated by `concurrency` threads. A token bucket
+           keeps the chat model calls under `requests_per_minute`.
+
+    Each answer is written and flushed as soon as it is ready, and also stored in the
+    answer cache, so the app serves these questions without a model call. With
+    `resume`, questions already in the results file for the same book selection are
+    skipped. Failed questions are not written, so a rerun retries them.
+
+    Args:
+        questions (list): The questions.
+        output_path (str): JSONL results file.
+        books (list): BOOKS keys to answer from, or None for all books.
+        k (int): Number of pages to retrieve per question.
+        concurrency (int): Number of generation threads.
+        requests_per_minute (float): Rate limit for the chat model.
+        resume (bool): Skip questions already answered in `output_path`.
+
+    Returns:
+        dict: Counts, per-stage seconds and throughput in questions per minute.
+    """
+    started = time.perf_counter()
+    selection = cache_selection(books, k)
+    done = load_done(output_path) if resume else set()
+    pending = [question for question in dict.fromkeys(questions) if (selection, question) not in done]
+    report = {"questions": len(questions), "skipped": len(questions) - len(pending), "answered": 0, "failed": 0}
+    print(f"{len(pending)} questions to answer for {selection}, {report['skipped']} already in {output_path}")
+    if not pending:
+        return report
+
+    stage_start = time.perf_counter()
+    vectors = []
+    for i in range(0, len(pending), EMBED_BATCH_SIZE):
+        vectors.extend(embed_questions(pending[i:i + EMBED_BATCH_SIZE]))
+    report["embed_seconds"] = round(time.perf_counter() - stage_start, 3)
+
+    stage_start = time.perf_counter()
+    retrieved = retrieve_many(pending, vectors, books=books, k=k)
+    report["search_seconds"] = round(time.perf_counter() - stage_start, 3)
+
+    bucket = TokenBucket(requests_per_minute / 60.0, capacity=concurrency)
+
+    def generate(i):
+        waited = bucket.acquire()
+        generation_start = time.perf_counter()
+        response = answer_from_docs(pending[i], retrieved[i][0])
+        return i, response["output_text"], time.perf_counter() - generation_start, waited
+
+    stage_start = time.perf_counter()
+    generation_seconds = wait_seconds = 0.0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool, open(output_path, "a", encoding="utf-8") as out:
+        futures = {pool.submit(generate, i): i for i in range(len(pending))}
+        for future in as_completed(futures):
+            question = pending[futures[future]]
+            try:
+                i, answer, seconds, waited = future.result()
+            except Exception as e:
+                report["failed"] += 1
+                print(f"Failed: {question!r}: {e}")
+                continue
+            docs, suggested_questions = retrieved[i]
+            out.write(json.dumps({
+                "selection": selection,
+                "question": question,
+                "answer": answer,
+                "pages": _pages(docs),
+                "suggested_questions": [doc.page_content for doc in suggested_questions],
+                "generation_seconds": round(seconds, 3),
+            }) + "\n")
+            out.flush()
+            answer_cache.store(selection, question, vectors[i], answer, docs, suggested_questions)
+            report["answered"] += 1
+            generation_seconds += seconds
+            wait_seconds += waited
+            print(f"[{report['answered'] + report['failed']}/{len(pending)}] {question}")
+
+    report["generate_seconds"] = round(time.perf_counter() - stage_start, 3)
+    report["mean_generation_seconds"] = round(generation_seconds / max(1, report["answered"]), 3)
+    report["rate_limit_wait_seconds"] = round(wait_seconds, 3)
+    report["total_seconds"] = round(time.perf_counter() - started, 3)
+    report["questions_per_minute"] = round(report["answered"] / max(1e-9, report["total_seconds"]) * 60, 2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer every question of a sheet in one batch.")
+    parser.add_argument("sheet", help="Question sheet (.xlsx or .csv); questions are in the first column.")
+    parser.add_argument("--sheet-name", default="Sheet1")
+    parser.add_argument("--skip-rows", type=int, default=1, help="Data rows to skip before the questions.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSONL results file (appended to).")
+    parser.add_argument("--book", action="append", choices=list(BOOKS), help="Book to answer from. Repeatable; default all.")
+    parser.add_argument("--k", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rpm", type=float, default=DEFAULT_REQUESTS_PER_MINUTE, help="Chat model requests per minute.")
+    parser.add_argument("--no-resume", action="store_true", help="Answer again questions already in the output file.")
+    args = parser.parse_args()
+
+    questions = read_questions(args.sheet, args.sheet_name, args.skip_rows)
+    report = run_batch(questions, args.output, books=normalize_books(args.book), k=args.k,
+                       concurrency=args.concurrency, requests_per_minute=args.rpm, resume=not args.no_resume)
+    print(json.dumps(report, indent=1))
@@ -0,0 +1,8 @@
+"""
+Offline benchmarks of the retrieval, extraction and answering paths.
+
+Run with `python -m benchmarks --help`. The chat model and embeddings are replaced by
+deterministic stubs with configurable latency (see `benchmarks.stubs`), while index
+loading, search, page lookup, image, extraction and chunking code run for real over
+the checked-in FAISS_INDEX_* directories and images.
+"""
@@ -0,0 +1,479 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import faiss
+
+import page_images
+from ann_index import percentile
+from benchmarks.stubs import StubChatModel, StubQAChain, stub_embeddings
+from chunking import chunk_documents, count_tokens
+from context_compression import compress_documents
+from embedding_backends import read_embedding_spec
+from filtered_search import book_partitions, reciprocal_rank_fusion, search_by_vector, search_by_vectors
+from index_registry import registry
+from lazy_index import index_files, load_lazy, migrate
+from lexical_index import BM25Index, lexical_index_path, lexical_search, save_lexical_index
+from page_lookup import PageLookupIndex
+from pdf_text import extract_pages
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+STAGES = ("index_load", "search", "page_lookup", "page_images", "extraction", "chunking", "end_to_end")
+ALL_BOOKS_INDEX = "FAISS_INDEX_ALL_BOOKS"
+QUESTIONS_INDEX = "FAISS_INDEX_Questions"
+PAGE_LOOKUP_SHEET = "Image_links.xlsx"
+# Regressions smaller than this are measurement noise, whatever the ratio.
+NOISE_FLOOR_MS = 0.05
+DEFAULT_THRESHOLD = 0.2
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process so far, in MB.
+
+    Every stage runs in a process of its own (see `run_stage`), so this is the peak of
+    the current stage, not the running maximum of the stages before it.
+    """
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def summarize(latencies, wall_seconds):
+    """
+    Summarizes per-operation latencies (seconds) measured over `wall_seconds`.
+    """
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        "count": len(ms),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "max_ms": round(max(ms), 3),
+        "throughput_per_s": round(len(ms) / wall_seconds, 2) if wall_seconds > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+class Recorder:
+    """
+    Collects one result per benchmark (stage.operation) and prints it as it is recorded.
+    """
+
+    def __init__(self):
+        self.results = {}
+
+    def record(self, name, latencies, wall_seconds, **extra):
+        if not latencies:
+            return
+        self.results[name] = dict(summarize(latencies, wall_seconds), **extra)
+        result = self.results[name]
+        print(f"{name:40s} n={result['count']:<5d} p50={result['p50_ms']:>10.3f}ms p95={result['p95_ms']:>10.3f}ms "
+              f"p99={result['p99_ms']:>10.3f}ms rss={result['peak_rss_mb']}MB")
+
+    def time_each(self, name, fn, items, **extra):
+        """
+        Calls `fn` on every item and records the latency of each call.
+        """
+        latencies = []
+        started = time.perf_counter()
+        for item in items:
+            call_started = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - call_started)
+        self.record(name, latencies, time.perf_counter() - started, **extra)
+
+    def fail(self, name, error):
+        self.results[name] = {"error": f"{type(error).__name__}: {error}"}
+        print(f"{name:40s} failed: {self.results[name]['error']}")
+
+
+# === Setup ===
+
+def prepare_indexes(index_dirs, workdir):
+    """
+    Copies the index directories into `workdir` and converts the copies to the lazy
+    format (with a BM25 index) where needed. The checked-in directories are never modified.
+
+    Returns:
+        dict: Mapping of index directory name to its prepared copy.
+    """
+    prepared = {}
+    for index_dir in index_dirs:
+        name = os.path.basename(os.path.normpath(index_dir))
+        target = os.path.join(workdir, name)
+        shutil.copytree(index_dir, target)
+        if not os.path.exists(index_files(target)[1]):
+            migrate(target)
+        prepared[name] = target
+    return prepared
+
+
+def ensure_lexical_index(index_dir, embeddings):
+    if os.path.exists(lexical_index_path(index_dir)):
+        return
+    store = load_lazy(index_dir, embeddings)
+    ids = list(store.index_to_docstore_id.values())
+    docs = [store.docstore.search(doc_id) for doc_id in ids]
+    save_lexical_index(index_dir, ids, [doc.page_content for doc in docs], [doc.metadata for doc in docs])
+
+
+def sample_questions(questions_dir, embeddings, count):
+    """
+    Returns `count` questions from the questions index, cycling when it has fewer.
+    """
+    questions = []
+    if questions_dir is not None:
+        store = load_lazy(questions_dir, embeddings)
+        for doc_id in store.index_to_docstore_id.values():
+            doc = store.docstore.search(doc_id)
+            if not isinstance(doc, str) and doc.page_content.strip():
+                questions.append(doc.page_content.strip())
+    questions = questions or ["What is Branding ?", "How does a brand grows ?", "Explain Brand Value Growth Matrix ."]
+    return [questions[i % len(questions)] for i in range(count)]
+
+
+def build_sample_pdf(path, texts, image_paths):
+    """
+    Writes a PDF with one text-layer page per text and one image-only page per image,
+    so extraction exercises both the text layer and the OCR fallback.
+    """
+    import fitz
+
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, page.rect.width - 36, page.rect.height - 36), text, fontsize=9)
+    for image_path in image_paths:
+        page = doc.new_page()
+        page.insert_image(page.rect, filename=image_path)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+# === Stages ===
+
+def bench_index_load(ctx, recorder):
+    for name, index_dir in ctx["indexes"].items():
+        recorder.time_each(f"index_load.{name}", lambda _: load_lazy(index_dir, ctx["embeddings"]), range(ctx["repeat"]),
+                           bytes=os.path.getsize(index_files(index_dir)[0]))
+    index_dir = ctx["all_books"]
+    registry.get_index(index_dir, ctx["embeddings"])
+    recorder.time_each("index_load.registry_hit", lambda _: registry.get_index(index_dir, ctx["embeddings"]),
+                       range(ctx["repeat"] * 100))
+
+
+def bench_search(ctx, recorder):
+    store = load_lazy(ctx["all_books"], ctx["embeddings"])
+    questions, k = ctx["questions"], ctx["k"]
+    vectors = ctx["embeddings"].embed_documents(questions)
+    positions = range(len(questions))
+
+    recorder.time_each("search.vector", lambda i: search_by_vector(store, vectors[i], k), positions)
+    books = sorted(book_partitions(store))
+    if books:
+        recorder.time_each("search.vector_one_book",
+                           lambda i: search_by_vector(store, vectors[i], k, [books[i % len(books)]]), positions)
+
+    # One matrix query; the per-question latency is the amortized share
+    started = time.perf_counter()
+    vector_results = search_by_vectors(store, vectors, k)
+    wall = time.perf_counter() - started
+    recorder.record("search.vector_batched", [wall / len(questions)] * len(questions), wall)
+
+    bm25 = BM25Index.load(lexical_index_path(ctx["all_books"]))
+    lexical_results = []
+    recorder.time_each("search.bm25", lambda i: lexical_results.append(lexical_search(store, bm25, questions[i], k)),
+                       positions)
+    fused = []
+    recorder.time_each("search.rrf", lambda i: fused.append(reciprocal_rank_fusion([vector_results[i], lexical_results[i]], k)),
+                       positions)
+    recorder.time_each("search.compress", lambda i: compress_documents(questions[i], [doc for doc, _ in fused[i]]),
+                       positions)
+
+
+def bench_page_lookup(ctx, recorder):
+    if not os.path.exists(PAGE_LOOKUP_SHEET):
+        raise FileNotFoundError(PAGE_LOOKUP_SHEET)
+    recorder.time_each("page_lookup.build", lambda _: PageLookupIndex(PAGE_LOOKUP_SHEET), range(ctx["repeat"]))
+    lookup = PageLookupIndex(PAGE_LOOKUP_SHEET)
+    recorder.time_each("page_lookup.lookup", lookup.lookup, ctx["questions"])
+
+
+def bench_page_images(ctx, recorder):
+    # Display JPEGs are rendered into the work directory, not next to the real images
+    display_dir = page_images.DISPLAY_DIR
+    page_images.DISPLAY_DIR = os.path.join(ctx["workdir"], "display")
+    try:
+        recorder.time_each("page_images.map", lambda _: page_images.get_page_image_map(), range(1))
+        pages = sorted(page_images.get_page_image_map())[:len(ctx["questions"])]
+        # The first pass renders the display JPEGs; the second hits the memo
+        recorder.time_each("page_images.display_first", lambda page: page_images.get_display_image(*page), pages)
+        recorder.time_each("page_images.display_warm", lambda page: page_images.get_display_image(*page), pages)
+    finally:
+        page_images.DISPLAY_DIR = display_dir
+
+
+def bench_extraction(ctx, recorder):
+    pdfs = ctx["pdfs"]
+    if not pdfs:
+        store = load_lazy(ctx["all_books"], ctx["embeddings"])
+        doc_ids = list(store.index_to_docstore_id.values())[:ctx["sample_pages"]]
+        texts = [store.docstore.search(doc_id).page_content for doc_id in doc_ids]
+        images = sorted(glob.glob(os.path.join(page_images.IMAGE_DIR, "*.png")))[:ctx["sample_images"]]
+        pdfs = [build_sample_pdf(os.path.join(ctx["workdir"], "sample.pdf"), texts, images)]
+    for pdf in pdfs:
+        latencies = []
+        started = time.perf_counter()
+        pages = list(extract_pages(pdf, workers=ctx["workers"]))
+        wall = time.perf_counter() - started
+        # Pages are extracted together, so each page gets the amortized share
+        latencies.extend([wall / max(1, len(pages))] * len(pages))
+        methods = {}
+        for page in pages:
+            methods[page.method] = methods.get(page.method, 0) + 1
+        recorder.record(f"extraction.{os.path.basename(pdf)}", latencies, wall, pages=len(pages), methods=methods)
+
+
+def bench_chunking(ctx, recorder):
+    store = load_lazy(ctx["all_books"], ctx["embeddings"])
+    docs = [store.docstore.search(doc_id) for doc_id in store.index_to_docstore_id.values()]
+    tokens = sum(count_tokens(doc.page_content) for doc in docs)
+    recorder.time_each("chunking.chunk_documents", lambda _: chunk_documents(docs), range(ctx["repeat"]),
+                       documents=len(docs), tokens=tokens)
+    recorder.time_each("chunking.count_tokens", lambda doc: count_tokens(doc.page_content), docs)
+
+
+@contextmanager
+def offline_main(ctx):
+    """
+    Imports main with the stub chat model and embeddings, the prepared index copies
+    and throwaway caches in the work directory, and restores it afterwards.
+
+    The cache paths are set before the import, so main never creates its SQLite
+    files in the current directory.
+    """
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    for variable, filename in [("ANSWER_CACHE_PATH", "answer_cache.sqlite"),
+                               ("PRECOMPUTED_ANSWERS_PATH", "precomputed_answers.sqlite"),
+                               ("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")]:
+        os.environ[variable] = os.path.join(ctx["workdir"], filename)
+    import main
+    from answer_cache import AnswerCache
+
+    chat_model = StubChatModel(ctx["llm_first_token"], ctx["llm_tokens_per_second"], ctx["llm_answer_tokens"])
+    patches = {
+        "get_embeddings": lambda: ctx["embeddings"],
+        "get_chat_model": lambda: chat_model,
+        "get_qa_chain": lambda: StubQAChain(chat_model, main.get_prompt()),
+        # A negative distance never matches, so every question takes the full path
+        "answer_cache": AnswerCache(main.ANSWER_CACHE_PATH, max_distance=-1.0),
+        "ALL_BOOKS_INDEX": ctx["all_books"],
+        "QUESTIONS_INDEX": ctx["indexes"].get(QUESTIONS_INDEX, main.QUESTIONS_INDEX),
+        "BOOKS": {name: dict(book, index=ctx["indexes"].get(book["index"], book["index"]))
+                  for name, book in main.BOOKS.items()},
+    }
+    saved = {name: getattr(main, name) for name in patches}
+    for name, value in patches.items():
+        setattr(main, name, value)
+    try:
+        yield main
+    finally:
+        for name, value in saved.items():
+            setattr(main, name, value)
+
+
+def bench_end_to_end(ctx, recorder):
+    questions = ctx["questions"][:ctx["end_to_end_questions"]]
+    with offline_main(ctx) as main:
+        recorder.time_each("end_to_end.user_input", main.user_input, questions)
+        first_tokens, totals = [], []
+        started = time.perf_counter()
+        for question in questions:
+            answer_stream, _, _ = main.stream_user_input(question)
+            for _ in answer_stream:
+                pass
+            first_tokens.append(answer_stream.time_to_first_token)
+            totals.append(answer_stream.total_seconds)
+        wall = time.perf_counter() - started
+        recorder.record("end_to_end.stream_first_token", first_tokens, wall)
+        recorder.record("end_to_end.stream_total", totals, wall)
+
+
+STAGE_FUNCTIONS = {
+    "index_load": bench_index_load,
+    "search": bench_search,
+    "page_lookup": bench_page_lookup,
+    "page_images": bench_page_images,
+    "extraction": bench_extraction,
+    "chunking": bench_chunking,
+    "end_to_end": bench_end_to_end,
+}
+
+
+def run_stage(stage, ctx, embedding_args):
+    """
+    Worker: runs one stage in a fresh process and returns its results.
+
+    A fresh process per stage keeps `peak_rss_mb` to the memory of that stage alone.
+    The stub embeddings are rebuilt from `embedding_args` on this side.
+    """
+    ctx = dict(ctx, embeddings=stub_embeddings(**embedding_args))
+    recorder = Recorder()
+    try:
+        STAGE_FUNCTIONS[stage](ctx, recorder)
+    except Exception as e:
+        traceback.print_exc()
+        recorder.fail(stage, e)
+    return recorder.results
+
+
+# === Comparison ===
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares two result files' benchmarks and returns the regressions.
+
+    A benchmark regresses when its p50 or p95 grew by more than `threshold` (a fraction)
+    and by more than NOISE_FLOOR_MS.
+
+    Returns:
+        list: (benchmark, metric, baseline value, new value) tuples.
+    """
+    regressions = []
+    print(f"\n{'benchmark':40s} {'metric':8s} {'baseline':>12s} {'new':>12s} {'change':>8s}")
+    for name, result in results["benchmarks"].items():
+        old = baseline["benchmarks"].get(name)
+        if old is None or "error" in old or "error" in result:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            change = (result[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            regressed = change > threshold and result[metric] - old[metric] > NOISE_FLOOR_MS
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{name:40s} {metric:8s} {old[metric]:>12.3f} {result[metric]:>12.3f} {change:>+8.1%}{flag}")
+            if regressed:
+                regressions.append((name, metric, old[metric], result[metric]))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    index_dirs = args.index_dirs or sorted(path for path in glob.glob("FAISS_INDEX_*") if os.path.isdir(path))
+    stages = args.stages.split(",") if args.stages else list(STAGES)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages {sorted(unknown)}, expected some of {STAGES}")
+
+    workdir = tempfile.mkdtemp(prefix="benchmarks-")
+    recorder = Recorder()
+    try:
+        indexes = prepare_indexes(index_dirs, workdir)
+        all_books = indexes.get(ALL_BOOKS_INDEX) or next(iter(indexes.values()))
+        spec = read_embedding_spec(all_books) or {"backend": "stub", "model": "stub-embedding"}
+        dimension = faiss.read_index(index_files(all_books)[0]).d
+        # The stub stands in for the embeddings the indexes were built with
+        embedding_args = {"dimension": dimension, "latency_seconds": args.embed_latency,
+                          "backend": spec["backend"], "model": spec["model"]}
+        embeddings = stub_embeddings(**embedding_args)
+        for index_dir in indexes.values():
+            ensure_lexical_index(index_dir, embeddings)
+
+        ctx = {
+            "workdir": workdir,
+            "indexes": indexes,
+            "all_books": all_books,
+            "questions": sample_questions(indexes.get(QUESTIONS_INDEX), embeddings, args.questions),
+            "k": args.k,
+            "repeat": args.repeat,
+            "pdfs": args.pdf,
+            "workers": args.workers,
+            "sample_pages": args.sample_pages,
+            "sample_images": args.sample_images,
+            "end_to_end_questions": args.end_to_end_questions,
+            "llm_first_token": args.llm_first_token,
+            "llm_tokens_per_second": args.llm_tokens_per_second,
+            "llm_answer_tokens": args.llm_answer_tokens,
+        }
+        # Spawned, not forked: a stage starts without the memory of setup or earlier stages
+        mp_context = multiprocessing.get_context("spawn")
+        for stage in stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as pool:
+                try:
+                    recorder.results.update(pool.submit(run_stage, stage, ctx, embedding_args).result())
+                except Exception as e:
+                    # The stage process died (out of memory, a crash in native code)
+                    recorder.fail(stage, e)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "benchmarks": recorder.results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Offline benchmarks with stub chat model and embeddings.")
+    parser.add_argument("index_dirs", nargs="*", help="Index directories (default: every FAISS_INDEX_* directory).")
+    parser.add_argument("--stages", help=f"Comma-separated subset of {','.join(STAGES)}.")
+    parser.add_argument("--questions", type=int, default=100, help="Queries per search and lookup benchmark.")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of load, build and chunking benchmarks.")
+    parser.add_argument("--pdf", action="append", help="PDF to extract (default: a generated sample). Repeatable.")
+    parser.add_argument("--workers", type=int, default=None, help="OCR processes.")
+    parser.add_argument("--sample-pages", type=int, default=20, help="Text pages in the generated sample PDF.")
+    parser.add_argument("--sample-images", type=int, default=3, help="Image-only pages in the generated sample PDF.")
+    parser.add_argument("--end-to-end-questions", type=int, default=10)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Stub embedding seconds per call.")
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="Stub chat model seconds to first token.")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--llm-answer-tokens", type=int, default=150)
+    parser.add_argument("--output", help="Results JSON file (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative p50/p95 growth reported as a regression.")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print(f"\nSaved results to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+            return 1
+    return 0
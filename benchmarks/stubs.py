@@ -0,0 +1,73 @@
+import hashlib
+import time
+from dataclasses import dataclass
+
+from bulk_embed import StubEmbedder
+
+
+@dataclass
+class StubMessage:
+    content: str
+
+
+class StubChatModel:
+    """
+    Deterministic offline stand-in for the chat model.
+
+    The answer is built from the prompt's own words, seeded by its hash, so the same
+    prompt always gets the same answer. `invoke` sleeps for the whole generation;
+    `stream` waits `first_token_seconds` and then yields one word every
+    1 / `tokens_per_second` seconds.
+
+    Args:
+        first_token_seconds (float): Delay before the first token.
+        tokens_per_second (float): Generation speed after the first token.
+        answer_tokens (int): Words per answer.
+    """
+
+    def __init__(self, first_token_seconds=0.3, tokens_per_second=100.0, answer_tokens=150):
+        self.first_token_seconds = first_token_seconds
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+
+    def _words(self, prompt):
+        words = prompt.split() or ["answer"]
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        return [words[(seed + i * 7919) % len(words)] for i in range(self.answer_tokens)]
+
+    def stream(self, prompt):
+        time.sleep(self.first_token_seconds)
+        for i, word in enumerate(self._words(prompt)):
+            if i:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield StubMessage(("" if i == 0 else " ") + word)
+
+    def invoke(self, prompt):
+        time.sleep(self.first_token_seconds + (self.answer_tokens - 1) / self.tokens_per_second)
+        return StubMessage(" ".join(self._words(prompt)))
+
+
+class StubQAChain:
+    """
+    Stand-in for the "stuff" QA chain: formats the prompt from the documents and
+    calls the stub chat model, returning {'output_text': ...} like the real chain.
+    """
+
+    def __init__(self, chat_model, prompt):
+        self.chat_model = chat_model
+        self.prompt = prompt
+
+    def __call__(self, inputs, return_only_outputs=True):
+        context = "\n\n".join(doc.page_content for doc in inputs["input_documents"])
+        text = self.prompt.format(context=context, question=inputs["question"])
+        return {"output_text": self.chat_model.invoke(text).content}
+
+
+def stub_embeddings(dimension, latency_seconds=0.0, backend="stub", model="stub-embedding"):
+    """
+    Returns deterministic offline embeddings (see `bulk_embed.StubEmbedder`).
+
+    Pass the backend and model recorded in an index's embedding.json to load that
+    index with the stub.
+    """
+    return StubEmbedder(dimension=dimension, latency_seconds=latency_seconds, backend=backend, model=model)
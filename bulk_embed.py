@@ -0,0 +1,365 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from chunking import count_tokens
+from rate_limit import TokenBucket
+
+# Gemini embedding-001 quota; lower it for keys with a smaller quota.
+DEFAULT_REQUESTS_PER_MINUTE = 1500
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_SIZE = 100
+MAX_BATCH_SIZE = 250
+# Seconds of budget that may be spent in one burst.
+BURST_SECONDS = 10
+
+_RATE_LIMIT_NAMES = {"ResourceExhausted", "TooManyRequests", "RateLimitError"}
+_TRANSIENT_NAMES = {"ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "GatewayTimeout",
+                    "TimeoutError", "ConnectionError", "ReadTimeout", "ConnectTimeout"}
+_TRANSIENT_STATUS_CODES = {408, 500, 502, 503, 504}
+_TRANSIENT_GRPC_CODES = {"UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL", "ABORTED"}
+_RATE_LIMIT_PATTERN = re.compile(r"\b429\b|rate limit|quota|resource (has been )?exhausted", re.IGNORECASE)
+_TRANSIENT_PATTERN = re.compile(
+    r"\b(408|500|502|503|504)\b|service unavailable|temporarily unavailable|deadline exceeded|timed out"
+    r"|internal server error|connection (reset|aborted|refused)",
+    re.IGNORECASE,
+)
+
+
+class RateLimitError(Exception):
+    """
+    Raised by `StubEmbedder` the way the API reports an exhausted quota (HTTP 429).
+    """
+    code = 429
+
+
+def error_chain(error):
+    """
+    Yields `error` and every exception it was raised from or while handling
+    (`__cause__` / `__context__`). Client wrappers such as LangChain's
+    GoogleGenerativeAIError hide the API error there.
+    """
+    seen = set()
+    stack = [error]
+    while stack:
+        error = stack.pop()
+        if error is None or id(error) in seen:
+            continue
+        seen.add(id(error))
+        yield error
+        stack.extend([error.__context__, error.__cause__])
+
+
+def _status_code(error):
+    for attribute in ("code", "status_code", "status"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _grpc_code(error):
+    return getattr(getattr(error, "grpc_status_code", None), "name", None)
+
+
+def _is_rate_limit(error):
+    return (
+        type(error).__name__ in _RATE_LIMIT_NAMES
+        or _status_code(error) == 429
+        or _grpc_code(error) == "RESOURCE_EXHAUSTED"
+        or _RATE_LIMIT_PATTERN.search(str(error)) is not None
+    )
+
+
+def _is_transient(error):
+    return (
+        type(error).__name__ in _TRANSIENT_NAMES
+        or isinstance(error, (TimeoutError, ConnectionError))
+        or _status_code(error) in _TRANSIENT_STATUS_CODES
+        or _grpc_code(error) in _TRANSIENT_GRPC_CODES
+        or _TRANSIENT_PATTERN.search(str(error)) is not None
+    )
+
+
+def is_rate_limit_error(error):
+    """
+    Returns True for quota errors (HTTP 429 / ResourceExhausted) from any client library,
+    also when they are wrapped in another exception.
+    """
+    return any(_is_rate_limit(cause) for cause in error_chain(error))
+
+
+def is_retryable(error):
+    """
+    Returns True for rate limits and transient failures (HTTP 408/5xx, unavailable,
+    deadline exceeded, timeouts, dropped connections) anywhere in the exception chain.
+    """
+    return any(_is_rate_limit(cause) or _is_transient(cause) for cause in error_chain(error))
+
+
+def text_key(text, model_name=None):
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model_name}|{digest}" if model_name else digest
+
+
+class BulkEmbedder:
+    """
+    Embeds large numbers of texts with concurrent, rate-limited and retried batch calls.
+
+    Up to `concurrency` batches are in flight at once. Each call first takes one
+    request and the batch's tokens from two token buckets, so the request and token
+    budgets hold across all threads. Batches start at `batch_size` texts. The size is
+    halved on every rate-limit error and grows again after a run of successes, and a
+    batch never exceeds the token burst allowance. Failed calls are retried with
+    exponential backoff and jitter. Errors that are neither rate limits nor transient
+    are raised at once.
+
+    With a `checkpoint_path`, every completed batch is appended to a JSONL file.
+    Texts found there are not embedded again, so an interrupted build resumes where
+    it stopped. Records are keyed on `model_name` plus the text, so a run resumed with
+    another model embeds everything again. Delete the file once the vectors are saved.
+
+    Args:
+        embed_fn (callable): Embeds a list of texts, e.g. `embeddings.embed_documents`.
+        requests_per_minute (float): Request budget.
+        tokens_per_minute (float): Token budget, counted with `chunking.count_tokens`.
+        concurrency (int): Maximum number of batches in flight.
+        batch_size (int): Initial texts per request.
+        max_batch_size (int): Upper bound for the adaptive batch size.
+        max_retries (int): Retries per batch before its error is raised.
+        backoff_seconds (float): Base delay of the exponential backoff.
+        checkpoint_path (str): JSONL file of completed batches, or None.
+        token_counter (callable): Returns the token count of a text.
+        model_name (str): Embedding model, part of the checkpoint keys.
+    """
+
+    def __init__(self, embed_fn, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, concurrency=DEFAULT_CONCURRENCY,
+                 batch_size=DEFAULT_BATCH_SIZE, max_batch_size=MAX_BATCH_SIZE, max_retries=6,
+                 backoff_seconds=1.0, checkpoint_path=None, token_counter=count_tokens,
+                 model_name=None):
+        self.embed_fn = embed_fn
+        self.concurrency = concurrency
+        self.batch_size = max(1, batch_size)
+        self.max_batch_size = max(self.batch_size, max_batch_size)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.checkpoint_path = checkpoint_path
+        self.token_counter = token_counter
+        self.model_name = model_name
+        self._requests = TokenBucket(requests_per_minute / 60.0, capacity=max(1.0, requests_per_minute / 60.0 * BURST_SECONDS))
+        self._tokens = TokenBucket(tokens_per_minute / 60.0, capacity=max(1.0, tokens_per_minute / 60.0 * BURST_SECONDS))
+        self._lock = threading.Lock()
+        self._successes = 0
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "texts": 0, "resumed": 0, "wait_seconds": 0.0}
+
+    # === Adaptive batch size ===
+
+    def _on_success(self):
+        with self._lock:
+            self._successes += 1
+            if self._successes >= 5 and self.batch_size < self.max_batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size * 3 // 2 + 1)
+                self._successes = 0
+
+    def _on_rate_limit(self):
+        with self._lock:
+            self._successes = 0
+            self.batch_size = max(1, self.batch_size // 2)
+            self.stats["rate_limited"] += 1
+
+    def _next_batch(self, pending, tokens):
+        """
+        Pops the next batch of positions off `pending`, within the batch size and token burst.
+        """
+        batch, batch_tokens = [], 0
+        while pending and len(batch) < self.batch_size:
+            if batch and batch_tokens + tokens[pending[0]] > self._tokens.capacity:
+                break
+            position = pending.popleft()
+            batch.append(position)
+            batch_tokens += tokens[position]
+        return batch, batch_tokens
+
+    # === Calls ===
+
+    def _embed_batch(self, texts, batch_tokens):
+        for attempt in range(self.max_retries + 1):
+            waited = self._requests.acquire()
+            waited += self._tokens.acquire(min(max(1, batch_tokens), self._tokens.capacity))
+            with self._lock:
+                self.stats["requests"] += 1
+                self.stats["wait_seconds"] += waited
+            try:
+                vectors = self.embed_fn(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                if is_rate_limit_error(e):
+                    self._on_rate_limit()
+                with self._lock:
+                    self.stats["retries"] += 1
+                delay = self.backoff_seconds * 2 ** attempt
+                time.sleep(delay + random.uniform(0, delay))
+                continue
+            self._on_success()
+            return vectors
+
+    # === Checkpoint ===
+
+    def _load_checkpoint(self):
+        vectors = {}
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return vectors
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A batch cut off by an interruption
+                vectors.update(zip(record["keys"], record["vectors"]))
+        return vectors
+
+    def _append_checkpoint(self, f, keys, vectors):
+        f.write(json.dumps({"keys": keys, "vectors": [list(map(float, vector)) for vector in vectors]}) + "\n")
+        f.flush()
+
+    def embed(self, texts):
+        """
+        Embeds `texts` and returns their vectors in the same order.
+        """
+        keys = [text_key(text, self.model_name) for text in texts]
+        checkpointed = self._load_checkpoint()
+        vectors = [checkpointed.get(key) for key in keys]
+        self.stats["resumed"] += sum(vector is not None for vector in vectors)
+
+        # Each distinct text is embedded once
+        first = {}
+        for position, key in enumerate(keys):
+            if vectors[position] is None:
+                first.setdefault(key, position)
+        pending = deque(first.values())
+        tokens = {position: self.token_counter(texts[position]) for position in pending}
+
+        checkpoint = open(self.checkpoint_path, "a", encoding="utf-8") if self.checkpoint_path else None
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                running = {}
+                while pending or running:
+                    while pending and len(running) < self.concurrency:
+                        batch, batch_tokens = self._next_batch(pending, tokens)
+                        running[pool.submit(self._embed_batch, [texts[p] for p in batch], batch_tokens)] = batch
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        batch = running.pop(future)
+                        batch_vectors = future.result()
+                        for position, vector in zip(batch, batch_vectors):
+                            vectors[position] = vector
+                        self.stats["texts"] += len(batch)
+                        if checkpoint is not None:
+                            self._append_checkpoint(checkpoint, [keys[p] for p in batch], batch_vectors)
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+        for position, key in enumerate(keys):
+            if vectors[position] is None:
+                vectors[position] = vectors[first[key]]
+        return vectors
+
+    def clear_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+
+class StubEmbedder(Embeddings):
+    """
+    Offline stand-in for the embedding API, for exercising builds and `BulkEmbedder`.
+
+    Vectors are deterministic pseudo-random unit vectors seeded by the text. Every call
+    sleeps `latency_seconds` plus `per_text_seconds` per text. It raises `RateLimitError`
+    with probability `rate_limit_probability`, and also whenever more than
+    `requests_per_minute` calls arrive within a minute. `backend` and `model` are what
+    `embedding_backends.embedding_spec` reports, so the stub can stand in for the
+    embeddings an existing index was built with.
+    """
+
+    def __init__(self, dimension=768, latency_seconds=0.05, per_text_seconds=0.0, rate_limit_probability=0.0,
+                 requests_per_minute=None, seed=0, backend="stub", model="stub-embedding"):
+        self.dimension = dimension
+        self.backend = backend
+        self.model = model
+        self.latency_seconds = latency_seconds
+        self.per_text_seconds = per_text_seconds
+        self.rate_limit_probability = rate_limit_probability
+        self.requests_per_minute = requests_per_minute
+        self._random = random.Random(seed)
+        self._calls = deque()
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _admit(self):
+        with self._lock:
+            self.calls += 1
+            now = time.monotonic()
+            while self._calls and now - self._calls[0] > 60:
+                self._calls.popleft()
+            self._calls.append(now)
+            if self.requests_per_minute is not None and len(self._calls) > self.requests_per_minute:
+                raise RateLimitError("429 Resource has been exhausted (stub requests per minute)")
+            if self._random.random() < self.rate_limit_probability:
+                raise RateLimitError("429 Resource has been exhausted (stub)")
+
+    def _vector(self, text):
+        rng = np.random.default_rng(int(text_key(text)[:16], 16))
+        vector = rng.standard_normal(self.dimension).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        self._admit()
+        time.sleep(self.latency_seconds + self.per_text_seconds * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def embed_queries(self, texts):
+        # Same batch interface as `embedding_cache.CachedEmbeddings`
+        return self.embed_documents(texts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exercise BulkEmbedder offline against the stub embedder.")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub seconds per call.")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Probability of a stub rate-limit error.")
+    parser.add_argument("--stub-rpm", type=int, default=None, help="Stub quota in calls per minute.")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_REQUESTS_PER_MINUTE)
+    parser.add_argument("--tpm", type=float, default=DEFAULT_TOKENS_PER_MINUTE)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--checkpoint", help="Checkpoint file, to try resuming.")
+    args = parser.parse_args()
+
+    stub = StubEmbedder(latency_seconds=args.latency, rate_limit_probability=args.error_rate,
+                        requests_per_minute=args.stub_rpm)
+    embedder = BulkEmbedder(stub.embed_documents, requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                            concurrency=args.concurrency, batch_size=args.batch_size, backoff_seconds=0.1,
+                            checkpoint_path=args.checkpoint)
+    texts = [f"Synthetic chunk {i} about brands, marketing and advertising." for i in range(args.texts)]
+    started = time.perf_counter()
+    embedder.embed(texts)
+    seconds = time.perf_counter() - started
+    print(json.dumps(dict(embedder.stats, seconds=round(seconds, 3), final_batch_size=embedder.batch_size,
+                          texts_per_second=round(args.texts / seconds, 1)), indent=1))
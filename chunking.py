@@ -0,0 +1,147 @@
+import json
+import os
+import re
+
+from langchain.docstore.document import Document
+
+DEFAULT_TARGET_TOKENS = 400
+DEFAULT_OVERLAP_TOKENS = 40
+CHUNK_STATS_NAME = "chunk_stats.json"
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_HEADER_PATTERN = re.compile(r"^Book:\s*.+?\s*,\s*Page Number\s*-\s*\d+\s*,\s*")
+
+
+def count_tokens(text):
+    """
+    Approximates the number of model tokens in `text` as words plus punctuation marks.
+
+    This tracks sub-word tokenizers closely enough for sizing chunks and needs no
+    tokenizer download.
+    """
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def split_sentences(text):
+    """
+    Splits text on sentence ends and blank lines, dropping empty pieces.
+    """
+    return [sentence.strip() for sentence in _SENTENCE_PATTERN.split(text) if sentence.strip()]
+
+
+def split_header(text):
+    """
+    Splits a 'Book: ..., Page Number - N, ' header off a page or chunk text.
+
+    Returns:
+        tuple: (header, body). The header is empty when the text has none.
+    """
+    match = _HEADER_PATTERN.match(text)
+    if not match:
+        return "", text
+    return match.group(0), text[match.end():]
+
+
+def _units(text, target_tokens, token_counter):
+    """
+    Splits text into sentences, breaking any sentence longer than the budget on words.
+    """
+    for sentence in split_sentences(text):
+        tokens = token_counter(sentence)
+        if tokens <= target_tokens:
+            yield sentence, tokens
+            continue
+        words = sentence.split()
+        step = max(1, target_tokens // 2)
+        for start in range(0, len(words), step):
+            piece = " ".join(words[start:start + step])
+            yield piece, token_counter(piece)
+
+
+def chunk_text(text, target_tokens=DEFAULT_TARGET_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS, token_counter=count_tokens):
+    """
+    Packs whole sentences into chunks of at most about `target_tokens` tokens.
+
+    Consecutive chunks share up to `overlap_tokens` tokens of trailing sentences.
+
+    Returns:
+        list: The chunk texts.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for unit, tokens in _units(text, target_tokens, token_counter):
+        if current and current_tokens + tokens > target_tokens:
+            chunks.append(" ".join(u for u, _ in current))
+            overlap, overlap_count = [], 0
+            for previous in reversed(current):
+                if overlap_count + previous[1] > overlap_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_count += previous[1]
+            if overlap_count + tokens > target_tokens:
+                overlap, overlap_count = [], 0
+            current, current_tokens = overlap, overlap_count
+        current.append((unit, tokens))
+        current_tokens += tokens
+    if current:
+        chunks.append(" ".join(u for u, _ in current))
+    return chunks
+
+
+def chunk_documents(documents, target_tokens=DEFAULT_TARGET_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS, token_counter=count_tokens):
+    """
+    Splits page Documents into token-budgeted chunks that never cross a page boundary.
+
+    Every chunk keeps its page's metadata plus 'chunk' (index within the page) and
+    'tokens'. When the page metadata has 'book' and 'page', each chunk starts with the
+    usual 'Book: ..., Page Number - N, ' header so the model still sees the source.
+
+    Args:
+        documents (list): One Document per page.
+        target_tokens (int): Token budget per chunk, header excluded.
+        overlap_tokens (int): Tokens shared between consecutive chunks of a page.
+        token_counter (callable): Returns the token count of a string.
+
+    Returns:
+        list: The chunk Documents, in page order.
+    """
+    chunks = []
+    for document in documents:
+        metadata = document.metadata
+        text = document.page_content
+        header = ""
+        if metadata.get("book") and metadata.get("page") is not None:
+            header = f"Book: {metadata['book']}, Page Number - {metadata['page']}, "
+            text = _HEADER_PATTERN.sub("", text, count=1)
+        for index, piece in enumerate(chunk_text(text, target_tokens, overlap_tokens, token_counter) or [""]):
+            chunk_metadata = dict(metadata, chunk=index, tokens=token_counter(piece))
+            chunks.append(Document(page_content=header + piece, metadata=chunk_metadata))
+    return chunks
+
+
+def chunk_stats(chunks, token_counter=count_tokens):
+    """
+    Summarizes chunk sizes in tokens: count, total, min, mean, median, p95 and max.
+    """
+    sizes = sorted(chunk.metadata.get("tokens", token_counter(chunk.page_content)) for chunk in chunks)
+    if not sizes:
+        return {"chunks": 0}
+    return {
+        "chunks": len(sizes),
+        "total_tokens": sum(sizes),
+        "min_tokens": sizes[0],
+        "mean_tokens": round(sum(sizes) / len(sizes), 1),
+        "p50_tokens": sizes[len(sizes) // 2],
+        "p95_tokens": sizes[min(len(sizes) - 1, int(len(sizes) * 0.95))],
+        "max_tokens": sizes[-1],
+    }
+
+
+def save_chunk_stats(index_dir, stats, target_tokens, overlap_tokens):
+    """
+    Writes the chunk statistics of an index build to `index_dir`/chunk_stats.json.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, CHUNK_STATS_NAME), "w", encoding="utf-8") as f:
+        json.dump(dict(stats, target_tokens=target_tokens, overlap_tokens=overlap_tokens), f, indent=1)
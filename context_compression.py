@@ -0,0 +1,123 @@
+import math
+import re
+from collections import Counter
+
+from langchain.docstore.document import Document
+
+from chunking import count_tokens, split_header, split_sentences
+
+DEFAULT_MAX_CONTEXT_TOKENS = 1500
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+
+_WORD_PATTERN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or that the this to "
+    "was what when where which who why will with you your explain detail".split()
+)
+
+
+def lexical_terms(text):
+    """
+    Lowercases text into word terms, dropping stopwords and the prompt's filler words.
+    """
+    return [word for word in _WORD_PATTERN.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def _shingles(text, size=5):
+    words = _WORD_PATTERN.findall(text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def drop_near_duplicates(docs, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """
+    Removes documents whose 5-word shingles overlap an earlier (better ranked) one by at
+    least `threshold` Jaccard similarity.
+    """
+    kept, kept_shingles = [], []
+    for doc in docs:
+        shingles = _shingles(split_header(doc.page_content)[1])
+        if any(_jaccard(shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def compress_documents(question, docs, max_tokens=DEFAULT_MAX_CONTEXT_TOKENS, duplicate_threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """
+    Shrinks retrieved documents to the sentences most relevant to the question.
+
+    Near-duplicate documents and repeated sentences are dropped first. If the rest still
+    exceeds `max_tokens`, sentences are ranked with a local BM25-style lexical score
+    against the question (IDF computed over the retrieved sentences) and the best ones
+    are kept until the budget is reached. Kept sentences stay in their original order
+    under their document's 'Book: ..., Page Number - N' header, and the metadata is kept.
+
+    Args:
+        question (str): The user's question.
+        docs (list): Retrieved Documents, best first.
+        max_tokens (int): Hard ceiling on the tokens of the returned context.
+        duplicate_threshold (float): Shingle Jaccard similarity above which a document is dropped.
+
+    Returns:
+        list: The compressed Documents, in retrieval order. Documents left without any
+        sentence are omitted.
+    """
+    docs = drop_near_duplicates(docs, duplicate_threshold)
+
+    seen = set()
+    entries = []  # (doc position, sentence position, sentence, tokens)
+    headers = []
+    for doc_position, doc in enumerate(docs):
+        header, body = split_header(doc.page_content)
+        headers.append((header, count_tokens(header)))
+        for sentence_position, sentence in enumerate(split_sentences(body)):
+            key = " ".join(_WORD_PATTERN.findall(sentence.lower()))
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            entries.append((doc_position, sentence_position, sentence, count_tokens(sentence)))
+
+    total = sum(entry[3] for entry in entries) + sum(tokens for _, tokens in headers)
+    if total <= max_tokens:
+        selected = entries
+    else:
+        sentence_terms = [lexical_terms(entry[2]) for entry in entries]
+        document_frequency = Counter(term for terms in sentence_terms for term in set(terms))
+        average_length = sum(len(terms) for terms in sentence_terms) / max(1, len(sentence_terms))
+        query_terms = set(lexical_terms(question))
+
+        def score(position):
+            terms = sentence_terms[position]
+            counts = Counter(terms)
+            result = 0.0
+            for term in query_terms & counts.keys():
+                idf = math.log(1 + (len(entries) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                tf = counts[term]
+                result += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * len(terms) / max(1.0, average_length)))
+            return result
+
+        # Best scores first; ties keep retrieval order
+        ranked = sorted(range(len(entries)), key=lambda position: (-score(position), entries[position][:2]))
+        selected, used, used_docs = [], 0, set()
+        for position in ranked:
+            entry = entries[position]
+            cost = entry[3] + (0 if entry[0] in used_docs else headers[entry[0]][1])
+            if used + cost > max_tokens:
+                continue
+            selected.append(entry)
+            used += cost
+            used_docs.add(entry[0])
+        selected.sort(key=lambda entry: entry[:2])
+
+    by_doc = {}
+    for doc_position, _, sentence, _ in selected:
+        by_doc.setdefault(doc_position, []).append(sentence)
+    return [
+        Document(page_content=headers[position][0] + " ".join(sentences), metadata=docs[position].metadata)
+        for position, sentences in sorted(by_doc.items())
+    ]
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+BACKENDS = ("google", "local")
+DEFAULT_GOOGLE_MODEL = "models/embedding-001"
+EMBEDDING_SPEC_NAME = "embedding.json"
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class EmbeddingMismatchError(ValueError):
+    """
+    Raised when an index is loaded with embeddings other than the ones it was built with.
+    """
+
+
+class LocalStaticEmbeddings(Embeddings):
+    """
+    CPU embedding model made of one static vector per vocabulary word.
+
+    A text's vector is the mean of the vectors of its lowercased words, L2-normalized.
+    A whole batch is encoded with one gather and one `np.add.reduceat`, and batches
+    are spread over `threads` threads. This takes a few milliseconds per query and
+    needs no network.
+
+    The model file is a .npz archive with 'vocab' (N strings), 'vectors' (an N x d
+    float matrix) and optionally 'weights' (N per-word weights, e.g. IDF), which are
+    folded into the vectors at load time.
+
+    Args:
+        path (str): The .npz model file.
+        threads (int): Encoding threads. Defaults to the number of CPUs.
+        batch_size (int): Texts per encoding call.
+    """
+
+    backend = "local"
+
+    def __init__(self, path, threads=None, batch_size=256):
+        with np.load(path, allow_pickle=False) as data:
+            vocab = [str(word) for word in data["vocab"]]
+            vectors = np.asarray(data["vectors"], dtype=np.float32)
+            if "weights" in data.files:
+                vectors = vectors * np.asarray(data["weights"], dtype=np.float32)[:, None]
+        if len(vocab) != len(vectors):
+            raise ValueError(f"{path}: {len(vocab)} vocabulary words for {len(vectors)} vectors")
+        self.word_ids = {word: i for i, word in enumerate(vocab)}
+        self.vectors = np.ascontiguousarray(vectors)
+        self.dimension = self.vectors.shape[1]
+        self.threads = threads or os.cpu_count() or 1
+        self.batch_size = batch_size
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        # The file content is part of the model id, so replacing the file is detected
+        self.model = f"{os.path.basename(path)}@{digest[:12]}"
+
+    def _encode(self, texts):
+        ids, offsets, counts = [], [], []
+        for text in texts:
+            offsets.append(len(ids))
+            word_ids = [self.word_ids[word] for word in _WORD_PATTERN.findall(text.lower()) if word in self.word_ids]
+            ids.extend(word_ids)
+            counts.append(len(word_ids))
+        result = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        counts = np.array(counts)
+        nonempty = counts > 0
+        if nonempty.any():
+            gathered = self.vectors[np.array(ids, dtype=np.int64)]
+            sums = np.add.reduceat(gathered, np.array(offsets)[nonempty], axis=0)
+            result[nonempty] = sums / counts[nonempty, None]
+        norms = np.linalg.norm(result, axis=1, keepdims=True)
+        return result / np.where(norms == 0, 1, norms)
+
+    def encode(self, texts):
+        """
+        Returns the embeddings of `texts` as a float32 matrix.
+        """
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if not batches:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        if self.threads == 1 or len(batches) == 1:
+            return np.vstack([self._encode(batch) for batch in batches])
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            return np.vstack(list(pool.map(self._encode, batches)))
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+    def embed_queries(self, texts):
+        return self.embed_documents(texts)
+
+
+def create_backend(name, model=None, threads=None):
+    """
+    Builds an embeddings object for a backend.
+
+    Args:
+        name (str): 'google' (remote API) or 'local' (`LocalStaticEmbeddings`).
+        model (str): Model name for 'google', path of the .npz file for 'local'.
+        threads (int): Encoding threads of the local backend.
+    """
+    if name == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        return GoogleGenerativeAIEmbeddings(model=model or DEFAULT_GOOGLE_MODEL)
+    if name == "local":
+        if not model:
+            raise ValueError("The local embedding backend needs the path of a .npz model file")
+        return LocalStaticEmbeddings(model, threads=threads)
+    raise ValueError(f"Unknown embedding backend '{name}', expected one of {BACKENDS}")
+
+
+def embedding_spec(embeddings):
+    """
+    Describes an embeddings object (unwrapping `CachedEmbeddings`) as
+    {'backend': ..., 'model': ..., 'dimension': ...}. The dimension is None when it is
+    only known after a call.
+    """
+    while hasattr(embeddings, "embeddings") and isinstance(embeddings.embeddings, Embeddings):
+        embeddings = embeddings.embeddings
+    backend = getattr(embeddings, "backend", None)
+    if backend is None:
+        backend = "google" if type(embeddings).__name__.startswith("GoogleGenerativeAI") else type(embeddings).__name__
+    return {
+        "backend": backend,
+        "model": getattr(embeddings, "model", type(embeddings).__name__),
+        "dimension": getattr(embeddings, "dimension", None),
+    }
+
+
+def write_embedding_spec(index_dir, spec):
+    path = os.path.join(index_dir, EMBEDDING_SPEC_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(spec, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def read_embedding_spec(index_dir):
+    """
+    Returns the embedding spec recorded in an index directory, or None for indexes
+    saved before specs were recorded.
+    """
+    path = os.path.join(index_dir, EMBEDDING_SPEC_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def embedding_spec_matches(index_dir, embeddings):
+    """
+    Returns False when the index in `index_dir` was built with another backend or model.
+    """
+    recorded = read_embedding_spec(index_dir)
+    current = embedding_spec(embeddings)
+    return recorded is None or (recorded["backend"], recorded["model"]) == (current["backend"], current["model"])
+
+
+def check_embedding_spec(index_dir, embeddings, dimension):
+    """
+    Rejects loading an index with embeddings other than the ones it was built with.
+
+    Args:
+        index_dir (str): The index directory, with the embedding.json written at build time.
+        embeddings: The embeddings the index is about to be queried with.
+        dimension (int): Dimension of the index's vectors.
+
+    Raises:
+        EmbeddingMismatchError: The backend, model or dimension differ.
+    """
+    current = embedding_spec(embeddings)
+    if current["dimension"] is not None and current["dimension"] != dimension:
+        raise EmbeddingMismatchError(
+            f"{index_dir} holds {dimension}-dimensional vectors but {current['model']} "
+            f"produces {current['dimension']}-dimensional ones"
+        )
+    if not embedding_spec_matches(index_dir, embeddings):
+        recorded = read_embedding_spec(index_dir)
+        raise EmbeddingMismatchError(
+            f"{index_dir} was built with {recorded['backend']}:{recorded['model']} but is being loaded with "
+            f"{current['backend']}:{current['model']}; rebuild the index or switch the embedding backend"
+        )
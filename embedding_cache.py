@@ -0,0 +1,132 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text):
+    """
+    Normalizes text for cache keys: collapses whitespace and lowercases.
+    """
+    return " ".join(str(text).split()).lower()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings object with an in-memory LRU in front of a SQLite store.
+
+    Vectors are keyed on the model name plus the normalized text, so re-running an
+    index build or asking the same question again never re-embeds text that has
+    already been seen, even across restarts. Only cache misses reach the wrapped
+    embeddings, and they are sent as one batch.
+
+    The LRU keeps float32 arrays (3 KB per 768-d vector) and holds query vectors
+    only; document vectors from index builds go to SQLite alone, so a build does not
+    evict the questions or grow the process.
+
+    Args:
+        embeddings (Embeddings): The embeddings object to wrap.
+        path (str): SQLite file for the on-disk store.
+        model_name (str): Model identifier used in the cache key. Defaults to
+            `embeddings.model` when present.
+        max_memory_items (int): Capacity of the in-memory LRU (query vectors).
+    """
+
+    def __init__(self, embeddings, path="embedding_cache.sqlite", model_name=None, max_memory_items=10000):
+        self.embeddings = embeddings
+        self.path = path
+        self.model_name = model_name or getattr(embeddings, "model", type(embeddings).__name__)
+        self.max_memory_items = max_memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _key(self, text, kind):
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model_name}|{kind}|{digest}"
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _embed(self, texts, kind, embed_fn, remember=True):
+        keys = [self._key(text, kind) for text in texts]
+        vectors = {}
+        if remember:
+            with self._lock:
+                for key in keys:
+                    if key in self._memory:
+                        self._memory.move_to_end(key)
+                        vectors[key] = self._memory[key]
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing:
+            with self._connect() as conn:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vectors[key] = np.frombuffer(blob, dtype=np.float32)
+
+        # Embed each distinct missing text once, in the order it was requested
+        to_embed = OrderedDict()
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in to_embed:
+                to_embed[key] = text
+        if to_embed:
+            new_vectors = [np.asarray(vector, dtype=np.float32) for vector in embed_fn(list(to_embed.values()))]
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in zip(to_embed, new_vectors)],
+                )
+            vectors.update(zip(to_embed, new_vectors))
+
+        with self._lock:
+            self.misses += len(to_embed)
+            self.hits += len(keys) - len(to_embed)
+            if remember:
+                for key in keys:
+                    self._remember(key, vectors[key])
+        # Lists only at the boundary; the cache itself holds float32 arrays
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_documents(self, texts):
+        return self._embed(texts, "document", self.embeddings.embed_documents, remember=False)
+
+    def embed_query(self, text):
+        return self._embed([text], "query", lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    def embed_queries(self, texts):
+        """
+        Embeds many questions at once. The vectors are the ones `embed_query` returns and
+        share its cache entries; misses go to the API as one batch request.
+        """
+        return self._embed(texts, "query", self._embed_query_batch)
+
+    def _embed_query_batch(self, texts):
+        try:
+            # Google embeddings embed a batch with the query task type in one request
+            return self.embeddings.embed_documents(texts, task_type="retrieval_query")
+        except TypeError:
+            return [self.embeddings.embed_query(text) for text in texts]
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of this process and the in-memory LRU size.
+        """
+        return {"hits": self.hits, "misses": self.misses, "memory_items": len(self._memory)}
@@ -0,0 +1,135 @@
+from collections import defaultdict
+
+import faiss
+import numpy as np
+
+from ann_index import search_parameters
+
+
+def book_partitions(store):
+    """
+    Groups the vector positions of a FAISS store by the 'book' metadata of their documents.
+
+    The grouping is computed once per loaded store and cached on it.
+
+    Args:
+        store (FAISS): A loaded LangChain FAISS vector store.
+
+    Returns:
+        dict: Mapping of book name to an int64 array of vector positions. Empty when the
+        documents carry no 'book' metadata (indexes built before metadata was stored).
+    """
+    cached = getattr(store, "_book_partitions", None)
+    if cached is not None and cached[0] == store.index.ntotal:
+        return cached[1]
+
+    # A SQLite docstore hands back all metadata in one query without reading page text.
+    all_metadata = getattr(store.docstore, "all_metadata", None)
+    metadata = all_metadata() if all_metadata is not None else {}
+    positions = defaultdict(list)
+    for position, doc_id in store.index_to_docstore_id.items():
+        if all_metadata is not None:
+            book = metadata.get(doc_id, {}).get("book")
+        else:
+            book = getattr(store.docstore.search(doc_id), "metadata", {}).get("book")
+        if book:
+            positions[book].append(position)
+    partitions = {book: np.array(ids, dtype="int64") for book, ids in positions.items()}
+    store._book_partitions = (store.index.ntotal, partitions)
+    return partitions
+
+
+def has_book_metadata(store):
+    return bool(book_partitions(store))
+
+
+def search_by_vector(store, query_vector, k, books=None):
+    """
+    Searches a FAISS store, optionally restricted to the vectors of some books.
+
+    The restriction is applied inside FAISS with an ID selector, so a per-book query on
+    the combined index scores only that book's vectors and always returns up to k hits.
+
+    Args:
+        store (FAISS): A loaded LangChain FAISS vector store.
+        query_vector (list): The query embedding.
+        k (int): Number of results.
+        books (list): Book names to restrict the search to, or None for the whole index.
+
+    Returns:
+        list: (Document, score) tuples, best first. Scores are the index's distances.
+    """
+    return search_by_vectors(store, [query_vector], k, books)[0]
+
+
+def search_by_vectors(store, query_vectors, k, books=None):
+    """
+    Batched `search_by_vector`: all queries go to FAISS as one matrix search.
+
+    Returns:
+        list: One list of (Document, score) tuples per query vector.
+    """
+    query = np.array(query_vectors, dtype=np.float32)
+    if getattr(store, "_normalize_L2", False):
+        faiss.normalize_L2(query)
+
+    if books is None:
+        scores, positions = store.index.search(query, k)
+    else:
+        partitions = book_partitions(store)
+        ids = [partitions[book] for book in books if book in partitions]
+        if not ids:
+            return [[] for _ in query_vectors]
+        selector = faiss.IDSelectorBatch(np.concatenate(ids))
+        scores, positions = store.index.search(query, k, params=search_parameters(store.index, selector))
+
+    all_results = []
+    for row_scores, row_positions in zip(scores, positions):
+        results = []
+        for score, position in zip(row_scores, row_positions):
+            if position == -1:
+                continue
+            doc = store.docstore.search(store.index_to_docstore_id[int(position)])
+            results.append((doc, float(score)))
+        all_results.append(results)
+    return all_results
+
+
+def higher_is_better(store):
+    """
+    Returns True when the store's scores are similarities (inner product) rather than distances.
+    """
+    return store.index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def merge_results(result_lists, k, higher_is_better=False):
+    """
+    Merges (Document, score) lists from several searches into one global top-k.
+
+    All lists must come from indexes built with the same embeddings and metric, so
+    their scores are comparable.
+    """
+    merged = [result for results in result_lists for result in results]
+    merged.sort(key=lambda result: result[1], reverse=higher_is_better)
+    return merged[:k]
+
+
+def reciprocal_rank_fusion(result_lists, k, rank_constant=60):
+    """
+    Fuses ranked (Document, score) lists whose scores are not comparable, such as a
+    vector search and a BM25 search, by reciprocal rank fusion.
+
+    Every document scores the sum of 1 / (rank_constant + rank) over the lists it
+    appears in. Documents are matched on their text.
+
+    Returns:
+        list: (Document, fused score) tuples, best first.
+    """
+    scores = defaultdict(float)
+    docs = {}
+    for results in result_lists:
+        for rank, (doc, _) in enumerate(results, start=1):
+            scores[doc.page_content] += 1.0 / (rank_constant + rank)
+            docs.setdefault(doc.page_content, doc)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(docs[text], score) for text, score in fused]
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+
+from langchain_community.vectorstores import FAISS
+
+from ann_index import convert_store
+from bulk_embed import DEFAULT_CONCURRENCY, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE, BulkEmbedder
+from embedding_backends import embedding_spec, embedding_spec_matches
+from lazy_index import index_files, load_lazy, save_lazy
+from lexical_index import lexical_index_path, save_lexical_index
+
+MANIFEST_NAME = "manifest.json"
+# Staging file (*.tmp), so the index registry does not reload while a build is running
+EMBEDDING_CHECKPOINT_NAME = "embedding_checkpoint.jsonl.tmp"
+
+
+def content_hash(text):
+    """
+    Returns the SHA-256 hex digest of a page or chunk text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(index_dir):
+    """
+    Reads the per-entry content hashes and index configuration saved next to an index.
+
+    Args:
+        index_dir (str): The FAISS index directory.
+
+    Returns:
+        tuple: (entries, index_spec) where entries maps entry id to content hash (empty
+        when there is no manifest) and index_spec is {'type': ..., 'params': ...}.
+    """
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}, None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return manifest["entries"], manifest.get("index", {"type": "flat", "params": {}})
+
+
+def save_manifest(index_dir, entries, index_spec):
+    path = os.path.join(index_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"entries": entries, "index": index_spec}, f)
+    os.replace(tmp_path, path)
+
+
+def update_index(index_dir, texts, embeddings, ids=None, metadatas=None, batch_size=100,
+                 index_type="flat", index_params=None, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Builds or incrementally updates the FAISS index saved in `index_dir`.
+
+    A manifest of content hashes is kept next to the index. On a rebuild only new or
+    changed entries are embedded, entries that disappeared are deleted, and the index
+    is saved back in place. Indexes without a manifest are rebuilt from scratch. A BM25
+    index of the same texts (see `lexical_index`) is saved alongside as bm25.json.
+
+    Approximate indexes ('hnsw', 'ivf', 'ivfpq', see `ann_index`) are retrained on the
+    whole corpus whenever anything changes, since HNSW cannot delete vectors and IVF
+    centroids drift. Only new or changed texts reach the embedding API; the rest come
+    from the embedding cache.
+
+    Args:
+        index_dir (str): Directory the index is saved to with `lazy_index.save_lazy`.
+        texts (list): The page or chunk texts that should be in the index.
+        embeddings: Embeddings object used to embed new or changed texts.
+        ids (list): Stable ids for the texts, e.g. "<book>#<page>". Defaults to content hashes.
+        metadatas (list): Optional metadata dict per text.
+        batch_size (int): Initial number of texts per `embed_documents` call (adapted by `BulkEmbedder`).
+        index_type (str): 'flat' (exact) or an approximate type from `ann_index.INDEX_TYPES`.
+        index_params (dict): Parameters for the approximate index, see `ann_index.default_params`.
+        requests_per_minute (float): Embedding request budget of the build.
+        tokens_per_minute (float): Embedding token budget of the build.
+        concurrency (int): Maximum number of embedding calls in flight.
+
+    Returns:
+        tuple: (vector_store, summary) where summary counts added, changed, removed and unchanged entries.
+    """
+    if not texts:
+        raise ValueError("Cannot build an index without any texts")
+    if ids is None:
+        ids = [content_hash(text) for text in texts]
+    if metadatas is None:
+        metadatas = [{} for _ in texts]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Index entry ids must be unique")
+
+    hashes = {entry_id: content_hash(text) for entry_id, text in zip(ids, texts)}
+    index_spec = {"type": index_type, "params": index_params or {}}
+    old_hashes, old_spec = load_manifest(index_dir)
+    if not embedding_spec_matches(index_dir, embeddings):
+        # Vectors from another embedding backend or model cannot be reused
+        old_hashes, old_spec = {}, None
+        checkpoint_path = os.path.join(index_dir, EMBEDDING_CHECKPOINT_NAME)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    can_update = (
+        bool(old_hashes)
+        and old_spec == index_spec
+        and index_type == "flat"
+        and os.path.exists(index_files(index_dir)[0])
+    )
+    # The BM25 index is cheap, so it is rebuilt from the full corpus once the vectors are saved
+    lexical_stale = old_hashes != hashes or not os.path.exists(lexical_index_path(index_dir))
+
+    if index_type != "flat" and old_spec == index_spec and old_hashes == hashes:
+        # Approximate index already up to date
+        vector_store = load_lazy(index_dir, embeddings)
+        if lexical_stale:
+            save_lexical_index(index_dir, ids, texts, metadatas)
+        return vector_store, {"added": 0, "changed": 0, "removed": 0, "unchanged": len(ids)}
+
+    changed = [entry_id for entry_id in ids if entry_id in old_hashes and old_hashes[entry_id] != hashes[entry_id]]
+    added = [entry_id for entry_id in ids if entry_id not in old_hashes]
+    removed = [entry_id for entry_id in old_hashes if entry_id not in hashes]
+
+    if can_update:
+        # Only open a writable staging copy when something will be written back
+        vector_store = load_lazy(index_dir, embeddings, mmap=not (removed or changed or added))
+        stale = removed + changed
+        if stale:
+            vector_store.delete(stale)
+    else:
+        vector_store = None
+
+    # A full build embeds everything (cached vectors make unchanged texts free)
+    to_embed = set(added) | set(changed) if can_update else set(ids)
+    positions = [i for i, entry_id in enumerate(ids) if entry_id in to_embed]
+    new_texts = [texts[i] for i in positions]
+    # Concurrent, rate-limited batches; completed batches survive an interrupted build
+    os.makedirs(index_dir, exist_ok=True)
+    spec = embedding_spec(embeddings)
+    embedder = BulkEmbedder(embeddings.embed_documents, requests_per_minute=requests_per_minute,
+                            tokens_per_minute=tokens_per_minute, concurrency=concurrency, batch_size=batch_size,
+                            checkpoint_path=os.path.join(index_dir, EMBEDDING_CHECKPOINT_NAME),
+                            model_name=f"{spec['backend']}/{spec['model']}")
+    vectors = embedder.embed(new_texts)
+    text_embeddings = list(zip(new_texts, vectors))
+    new_ids = [ids[i] for i in positions]
+    new_metadatas = [metadatas[i] for i in positions]
+
+    if vector_store is None:
+        vector_store = FAISS.from_embeddings(text_embeddings, embedding=embeddings, metadatas=new_metadatas, ids=new_ids)
+        if index_type != "flat":
+            vector_store = convert_store(vector_store, index_type, **(index_params or {}))
+    elif text_embeddings:
+        vector_store.add_embeddings(text_embeddings, metadatas=new_metadatas, ids=new_ids)
+
+    if removed or changed or added or not can_update:
+        save_lazy(vector_store, index_dir)
+        save_manifest(index_dir, hashes, index_spec)
+    embedder.clear_checkpoint()
+    if lexical_stale:
+        save_lexical_index(index_dir, ids, texts, metadatas)
+
+    summary = {
+        "added": len(added),
+        "changed": len(changed),
+        "removed": len(removed),
+        "unchanged": len(ids) - len(added) - len(changed),
+    }
+    print(f"Updated {index_dir}: {summary}")
+    return vector_store, summary
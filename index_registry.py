@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+from lazy_index import load_lazy
+
+
+@dataclass
+class IndexStats:
+    """
+    Load statistics for one entry in the registry.
+
+    Attributes:
+        path (str): The index directory (or file) the entry was loaded from.
+        load_seconds (float): Wall time spent by the most recent load.
+        memory_bytes (int): Estimated resident size of the loaded object.
+        loads (int): How many times the entry has been (re)loaded in this process.
+        loaded_at (float): Unix timestamp of the most recent load.
+    """
+    path: str
+    load_seconds: float
+    memory_bytes: int
+    loads: int
+    loaded_at: float
+
+
+def path_signature(path):
+    """
+    Builds a cheap change signature for a file or a directory of files.
+
+    The signature is made of the name, size and modification time of every file,
+    so rewriting an index with `save_lazy` changes it (it switches the CURRENT file).
+    Staging files (*.tmp, and the SQLite journals of staging databases) written during
+    a rebuild are ignored until they are swapped in, and so are subdirectories.
+
+    Args:
+        path (str): Path to a file or a directory.
+
+    Returns:
+        tuple: A hashable signature, or None if the path does not exist.
+    """
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return ((os.path.basename(path), stat.st_size, stat.st_mtime_ns),)
+    if not os.path.isdir(path):
+        return None
+    signature = []
+    for name in sorted(os.listdir(path)):
+        file_path = os.path.join(path, name)
+        if os.path.isfile(file_path) and not name.endswith((".tmp", ".tmp-journal")):
+            stat = os.stat(file_path)
+            signature.append((name, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def estimate_memory(obj):
+    """
+    Estimates the memory held by a loaded FAISS vector store.
+
+    Counts the raw vector storage plus the text of every document in the docstore.
+    Objects that are not vector stores fall back to `__sizeof__`.
+
+    Args:
+        obj: The loaded object.
+
+    Returns:
+        int: Estimated size in bytes.
+    """
+    index = getattr(obj, "index", None)
+    docstore = getattr(obj, "docstore", None)
+    if index is None or docstore is None:
+        return obj.__sizeof__()
+
+    vector_bytes = index.ntotal * index.d * 4
+    documents = getattr(docstore, "_dict", {})
+    text_bytes = sum(len(doc.page_content.encode("utf-8")) for doc in documents.values())
+    return vector_bytes + text_bytes
+
+
+class IndexRegistry:
+    """
+    Thread-safe, process-wide cache of loaded indexes.
+
+    Every Streamlit session runs in the same process, so one registry hands the same
+    loaded objects to all of them. Each entry is reloaded when the files behind it
+    change on disk.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path_locks = {}
+        self._entries = {}
+
+    def _path_lock(self, key):
+        with self._lock:
+            if key not in self._path_locks:
+                self._path_locks[key] = threading.Lock()
+            return self._path_locks[key]
+
+    def get(self, path, loader):
+        """
+        Returns the object loaded from `path`, loading it on first use or after a change.
+
+        Args:
+            path (str): File or directory the object is loaded from.
+            loader (callable): Called with `path` to build the object.
+
+        Returns:
+            The cached object.
+        """
+        key = os.path.abspath(path)
+        signature = path_signature(key)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        # Only one thread loads a given path; others wait and reuse its result.
+        with self._path_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                return entry[1]
+
+            start = time.perf_counter()
+            obj = loader(path)
+            load_seconds = time.perf_counter() - start
+
+            loads = entry[2].loads + 1 if entry is not None else 1
+            stats = IndexStats(
+                path=path,
+                load_seconds=load_seconds,
+                memory_bytes=estimate_memory(obj),
+                loads=loads,
+                loaded_at=time.time(),
+            )
+            self._entries[key] = (signature, obj, stats)
+            print(f"Loaded {path} in {load_seconds:.3f}s ({stats.memory_bytes / 1e6:.1f} MB)")
+            return obj
+
+    def get_index(self, index_dir, embeddings):
+        """
+        Returns the FAISS vector store saved in `index_dir`.
+
+        The vectors are memory-mapped and documents are read from SQLite only for the
+        hits, see `lazy_index.load_lazy`. Nothing is unpickled.
+
+        Args:
+            index_dir (str): Directory written by `lazy_index.save_lazy`.
+            embeddings: Embeddings object used to embed queries against the index.
+
+        Returns:
+            FAISS: The cached vector store.
+        """
+        return self.get(index_dir, lambda path: load_lazy(path, embeddings))
+
+    def invalidate(self, path=None):
+        """
+        Drops one cached entry, or all of them when `path` is None.
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+    def stats(self):
+        """
+        Returns the load statistics of every cached entry as a list of dicts.
+        """
+        return [asdict(entry[2]) for entry in list(self._entries.values())]
+
+
+registry = IndexRegistry()
@@ -0,0 +1,278 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import faiss
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from embedding_backends import DEFAULT_GOOGLE_MODEL, check_embedding_spec, embedding_spec, write_embedding_spec
+from lexical_index import save_lexical_index
+
+INDEX_NAME = "index.faiss"
+DOCSTORE_NAME = "docstore.sqlite"
+LEGACY_DOCSTORE_NAME = "index.pkl"
+# index.faiss and docstore.sqlite live together in a version directory; this file names
+# the current one and is swapped in one os.replace.
+CURRENT_NAME = "CURRENT"
+VERSION_PREFIX = "version_"
+
+# Memory-map the vectors where this FAISS build supports it (zero-copy flat codes in
+# newer releases, inverted lists of IVF indexes otherwise) so worker processes share pages.
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class SqliteDocstore(Docstore, AddableMixin):
+    """
+    Docstore that keeps documents in SQLite and fetches them one id at a time.
+
+    Only the documents of the top-k hits are ever read into memory. Each thread gets
+    its own connection, so searches can run on the shared thread pool.
+
+    Args:
+        path (str): The SQLite file.
+        read_only (bool): Open the file read-only (serving) instead of read-write (building).
+    """
+
+    def __init__(self, path, read_only=True):
+        self.path = path
+        self.read_only = read_only
+        self._local = threading.local()
+        if not read_only:
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+                )
+                conn.execute("CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, doc_id TEXT NOT NULL)")
+                conn.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def search(self, search):
+        row = self._connection().execute(
+            "SELECT page_content, metadata FROM documents WHERE id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts):
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO documents (id, page_content, metadata) VALUES (?, ?, ?)",
+                [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()],
+            )
+
+    def delete(self, ids):
+        with self._connection() as conn:
+            conn.executemany("DELETE FROM documents WHERE id = ?", [(doc_id,) for doc_id in ids])
+
+    def all_metadata(self):
+        """
+        Returns {id: metadata} for every document without reading any page text.
+        """
+        rows = self._connection().execute("SELECT id, metadata FROM documents").fetchall()
+        return {doc_id: json.loads(metadata) for doc_id, metadata in rows}
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def load_positions(self):
+        rows = self._connection().execute("SELECT position, doc_id FROM positions").fetchall()
+        return {position: doc_id for position, doc_id in rows}
+
+    def load_settings(self):
+        return dict(self._connection().execute("SELECT name, value FROM settings").fetchall())
+
+    def save_positions(self, index_to_docstore_id, settings):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM positions")
+            conn.executemany("INSERT INTO positions (position, doc_id) VALUES (?, ?)", index_to_docstore_id.items())
+            conn.executemany("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)", settings.items())
+
+
+def _settings(store):
+    return {"normalize_L2": json.dumps(store._normalize_L2), "distance_strategy": str(store.distance_strategy.value)}
+
+
+def current_version(index_dir):
+    """
+    Returns the name of the current version directory of `index_dir`, or None for an
+    index saved before versions (index.faiss and docstore.sqlite at the top level).
+    """
+    try:
+        with open(os.path.join(index_dir, CURRENT_NAME), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def index_files(index_dir):
+    """
+    Returns the (index.faiss, docstore.sqlite) paths of the current version of `index_dir`.
+    """
+    version = current_version(index_dir)
+    base = os.path.join(index_dir, version) if version else index_dir
+    return os.path.join(base, INDEX_NAME), os.path.join(base, DOCSTORE_NAME)
+
+
+def _new_version_dir(index_dir):
+    path = os.path.join(index_dir, f"{VERSION_PREFIX}{time.time_ns()}")
+    os.makedirs(path)
+    return path
+
+
+def _remove_old_versions(index_dir, keep):
+    """
+    Deletes the version directories older than every version in `keep`, and the
+    unversioned top-level files unless `keep` holds None (the unversioned layout).
+    Newer directories may be staging copies of another build and are left alone.
+    """
+    oldest_kept = min(name for name in keep if name)
+    for name in os.listdir(index_dir):
+        if name.startswith(VERSION_PREFIX) and name < oldest_kept:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+    if None in keep:
+        return
+    legacy_files = [DOCSTORE_NAME]
+    # A top-level index.faiss belongs to the legacy index.pkl while that is still there
+    if not os.path.exists(os.path.join(index_dir, LEGACY_DOCSTORE_NAME)):
+        legacy_files.append(INDEX_NAME)
+    for name in legacy_files:
+        if os.path.exists(os.path.join(index_dir, name)):
+            os.remove(os.path.join(index_dir, name))
+
+
+def save_lazy(store, index_dir):
+    """
+    Saves a LangChain FAISS store as index.faiss plus docstore.sqlite (no pickle), and
+    records the embedding backend, model and dimension in embedding.json.
+
+    The pair is written into a new version directory, and the CURRENT file is switched
+    to it with one `os.replace`, so readers always open an index and a docstore of the
+    same version. The previous version is kept for readers that loaded it before the
+    switch; older ones are deleted. A store opened with `load_lazy(..., mmap=False)`
+    already writes to its own version directory; any other docstore is copied into a
+    fresh SQLite file.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    docstore = store.docstore
+    staging_dir = os.path.dirname(os.path.abspath(docstore.path)) if isinstance(docstore, SqliteDocstore) else None
+    if (staging_dir is not None and not docstore.read_only
+            and os.path.dirname(staging_dir) == os.path.abspath(index_dir)
+            and os.path.basename(staging_dir).startswith(VERSION_PREFIX)):
+        version_dir = staging_dir
+        docstore.save_positions(store.index_to_docstore_id, _settings(store))
+    else:
+        version_dir = _new_version_dir(index_dir)
+        docstore = SqliteDocstore(os.path.join(version_dir, DOCSTORE_NAME), read_only=False)
+        docstore.add({doc_id: store.docstore.search(doc_id) for doc_id in store.index_to_docstore_id.values()})
+        docstore.save_positions(store.index_to_docstore_id, _settings(store))
+    docstore.close()
+    faiss.write_index(store.index, os.path.join(version_dir, INDEX_NAME))
+
+    if store.embedding_function is not None:
+        write_embedding_spec(index_dir, dict(embedding_spec(store.embedding_function), dimension=store.index.d))
+
+    previous = current_version(index_dir)
+    version = os.path.basename(version_dir)
+    tmp_current = os.path.join(index_dir, CURRENT_NAME + ".tmp")
+    with open(tmp_current, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_current, os.path.join(index_dir, CURRENT_NAME))
+    _remove_old_versions(index_dir, keep={version, previous})
+
+
+def load_lazy(index_dir, embeddings, mmap=True):
+    """
+    Loads an index saved by `save_lazy` without unpickling anything.
+
+    Args:
+        index_dir (str): Directory saved by `save_lazy` (or a migrated one).
+        embeddings: Embeddings object used to embed queries.
+        mmap (bool): Memory-map the vectors and open the docstore read-only (serving).
+            Use False to get a writable copy for incremental builds; its docstore is a
+            copy in a new version directory that `save_lazy` switches to.
+
+    Returns:
+        FAISS: The vector store, with a SqliteDocstore.
+
+    Raises:
+        EmbeddingMismatchError: `embeddings` are not the ones the index was built with.
+    """
+    index_path, docstore_path = index_files(index_dir)
+    if not os.path.exists(docstore_path):
+        raise FileNotFoundError(
+            f"{index_dir} has no {DOCSTORE_NAME}. Convert the legacy pickle once with "
+            f"'python lazy_index.py migrate {index_dir}'."
+        )
+    if mmap:
+        index = faiss.read_index(index_path, MMAP_FLAGS)
+        docstore = SqliteDocstore(docstore_path, read_only=True)
+    else:
+        index = faiss.read_index(index_path)
+        staging_path = os.path.join(_new_version_dir(index_dir), DOCSTORE_NAME)
+        shutil.copyfile(docstore_path, staging_path)
+        docstore = SqliteDocstore(staging_path, read_only=False)
+    check_embedding_spec(index_dir, embeddings, index.d)
+    settings = docstore.load_settings()
+    return FAISS(
+        embeddings,
+        index,
+        docstore,
+        docstore.load_positions(),
+        normalize_L2=json.loads(settings.get("normalize_L2", "false")),
+        distance_strategy=DistanceStrategy(settings.get("distance_strategy", DistanceStrategy.EUCLIDEAN_DISTANCE.value)),
+    )
+
+
+def migrate(index_dir, remove_pickle=False, backend="google", model=DEFAULT_GOOGLE_MODEL):
+    """
+    Converts a legacy `save_local` directory (index.pkl) into the lazy format.
+
+    This is the only place the pickled docstore is still read; run it once per index
+    on files you created yourself. `backend` and `model` are the embeddings the index
+    was built with; they are recorded in embedding.json. The BM25 index of the texts
+    (bm25.json, see `lexical_index`) is built alongside.
+    """
+    store = FAISS.load_local(index_dir, None, allow_dangerous_deserialization=True)
+    save_lazy(store, index_dir)
+    write_embedding_spec(index_dir, {"backend": backend, "model": model, "dimension": store.index.d})
+    ids = list(store.index_to_docstore_id.values())
+    docs = [store.docstore.search(doc_id) for doc_id in ids]
+    save_lexical_index(index_dir, ids, [doc.page_content for doc in docs], [doc.metadata for doc in docs])
+    if remove_pickle:
+        os.remove(os.path.join(index_dir, LEGACY_DOCSTORE_NAME))
+        # The index now lives in the version directory as well
+        os.remove(os.path.join(index_dir, INDEX_NAME))
+    print(f"Migrated {index_dir}: {len(store.index_to_docstore_id)} documents")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage lazily loaded FAISS indexes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="Convert index.pkl docstores to docstore.sqlite.")
+    migrate_parser.add_argument("index_dirs", nargs="+")
+    migrate_parser.add_argument("--remove-pickle", action="store_true")
+    migrate_parser.add_argument("--embedding-backend", default="google", help="Backend the indexes were built with.")
+    migrate_parser.add_argument("--embedding-model", default=DEFAULT_GOOGLE_MODEL, help="Model the indexes were built with.")
+    args = parser.parse_args()
+    for index_dir in args.index_dirs:
+        migrate(index_dir, remove_pickle=args.remove_pickle, backend=args.embedding_backend, model=args.embedding_model)
@@ -0,0 +1,123 @@
+import heapq
+import json
+import math
+import os
+from collections import Counter, defaultdict
+
+from context_compression import lexical_terms
+
+BM25_NAME = "bm25.json"
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+
+class BM25Index:
+    """
+    Inverted index over the texts of a FAISS index, scored with Okapi BM25.
+
+    Entries are identified by the same ids as the FAISS docstore, so hits are turned
+    back into Documents from the vector store. Searching needs no network call.
+
+    Args:
+        ids (list): Docstore id of every entry.
+        books (list): 'book' metadata of every entry (None when absent), for filtering.
+        lengths (list): Number of terms in every entry.
+        postings (dict): Mapping of term to a list of [entry position, term frequency].
+        k1 (float): Term frequency saturation.
+        b (float): Length normalization.
+    """
+
+    def __init__(self, ids, books, lengths, postings, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.ids = ids
+        self.books = books
+        self.lengths = lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.average_length = sum(lengths) / max(1, len(lengths))
+        self.idf = {
+            term: math.log(1 + (len(ids) - len(entries) + 0.5) / (len(entries) + 0.5))
+            for term, entries in postings.items()
+        }
+
+    @classmethod
+    def build(cls, ids, texts, metadatas=None, k1=DEFAULT_K1, b=DEFAULT_B):
+        """
+        Builds the index from the texts stored in a FAISS index.
+        """
+        metadatas = metadatas or [{} for _ in texts]
+        postings = defaultdict(list)
+        lengths = []
+        for position, text in enumerate(texts):
+            terms = lexical_terms(text)
+            lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                postings[term].append([position, count])
+        books = [metadata.get("book") for metadata in metadatas]
+        return cls(list(ids), books, lengths, dict(postings), k1, b)
+
+    def search(self, query, k, books=None):
+        """
+        Returns the k best entries for a query.
+
+        Args:
+            query (str): The question.
+            k (int): Number of results.
+            books (list): 'book' metadata values to restrict the search to, or None.
+
+        Returns:
+            list: (docstore id, score) tuples, best first. Entries sharing no term with the
+            query are never returned.
+        """
+        allowed = set(books) if books is not None else None
+        scores = defaultdict(float)
+        for term in set(lexical_terms(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position, count in self.postings[term]:
+                if allowed is not None and self.books[position] not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / max(1.0, self.average_length))
+                scores[position] += idf * count * (self.k1 + 1) / (count + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.ids[position], score) for position, score in best]
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "ids": self.ids, "books": self.books,
+                       "lengths": self.lengths, "postings": self.postings}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ids"], data["books"], data["lengths"], data["postings"], data["k1"], data["b"])
+
+
+def lexical_index_path(index_dir):
+    return os.path.join(index_dir, BM25_NAME)
+
+
+def save_lexical_index(index_dir, ids, texts, metadatas=None):
+    """
+    Builds the BM25 index of a FAISS index's texts and writes it to `index_dir`/bm25.json.
+    """
+    BM25Index.build(ids, texts, metadatas).save(lexical_index_path(index_dir))
+
+
+def lexical_search(store, bm25, query, k, books=None):
+    """
+    Runs a BM25 search and resolves the hits to Documents from the FAISS store's docstore.
+
+    Returns:
+        list: (Document, score) tuples, best first. Scores are BM25 scores (higher is better).
+    """
+    results = []
+    for doc_id, score in bm25.search(query, k, books):
+        doc = store.docstore.search(doc_id)
+        if not isinstance(doc, str):
+            results.append((doc, score))
+    return results
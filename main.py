@@ -1,171 +1,618 @@
-from langchain_community.vectorstores import FAISS
 from langchain.prompts import PromptTemplate
 import os
+from pathlib import Path
 import google.generativeai as genai
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.chains.question_answering import load_qa_chain
 import pandas as pd
 from langchain.retrievers.multi_query import MultiQueryRetriever
-from pdf2image import convert_from_path
 import streamlit as st
-import pytesseract
-
-genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-def extract_text_from_pdf(pdf_path):
-    # Convert PDF to images
-    pages = convert_from_path(pdf_path, 300)
-
-    # Iterate through all the pages and extract text
-    extracted_text = ''
-    for page_number, page_data in enumerate(pages):
-        # Perform OCR on the image
-        if(page_number >= 5):
-            text = pytesseract.image_to_string(page_data)
-            extracted_text += f"Page Number : {page_number + 1} \n\n{text}\n"
-        if(page_number == 28):
-            break
-    return extracted_text
-
-def get_text_chunks(text):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=10000, chunk_overlap=20)
-    return text_splitter.split_text(text)
-
-def get_vector_store(text_chunks, batch_size=100):
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    text_embeddings = []
-    
-    for i in range(0, len(text_chunks), batch_size):
-        batch = text_chunks[i:i + batch_size]
-        batch_embeddings = embeddings.embed_documents(batch)
-        text_embeddings.extend(zip(batch, batch_embeddings))
-    
-    vector_store = FAISS.from_embeddings(text_embeddings, embedding=embeddings)
-    vector_store.save_local("Faiss_Index_BOOK1")
-    return vector_store
+import time
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from index_registry import registry
+from answer_cache import AnswerCache
+from embedding_cache import CachedEmbeddings
+from embedding_backends import create_backend, embedding_spec
+from incremental_index import update_index
+from bulk_embed import DEFAULT_CONCURRENCY, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from pdf_text import extract_pages
+from chunking import chunk_text, chunk_documents, chunk_stats, save_chunk_stats, DEFAULT_TARGET_TOKENS, DEFAULT_OVERLAP_TOKENS
+from langchain.docstore.document import Document
+from context_compression import compress_documents
+from filtered_search import has_book_metadata, search_by_vector, search_by_vectors, merge_results, higher_is_better, reciprocal_rank_fusion
+from lexical_index import BM25Index, lexical_index_path, lexical_search
+from question_neighbors import NEIGHBORS_NAME, load_neighbors
+from precomputed_answers import PrecomputedAnswers, index_fingerprint
+from page_images import get_display_image, get_page_image_path
+from rate_limit import TokenBucket
+
+# The environment variable lets offline tools (benchmarks) run without a secrets file
+genai.configure(api_key=os.environ.get("GOOGLE_API_KEY") or st.secrets["GOOGLE_API_KEY"])
 
-def create_embeddings():
-    url_text_chunks = []
-    article_text = extract_text_from_pdf('The Smart Branding Book.pdf')
-    text_chunks = get_text_chunks(article_text)
-    for chunk in text_chunks:
-        url_text_chunks.append(f"{chunk}")
-    get_vector_store(url_text_chunks)
-
-def user_input(user_question):
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    prompt_template = """
+PROMPT_TEMPLATE = """
     Answer the question from the context provided.Explain in as much details as possible.
     Context:\n{context}?\n
     Question:\n{question} + Explain in detail .\n
     Answer:
     """
-    model = ChatGoogleGenerativeAI(model="gemini-1.0-pro", temperature=0.5)
-    # repo_id="mistralai/Mistral-7B-Instruct-v0.2"
-    # model=HuggingFaceEndpoint(repo_id=repo_id,max_length=128,temperature=0.7,token=sec_key)
-    prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-    chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
-      # Model for creating vector embeddings
-    new_db = FAISS.load_local("FAISS_INDEX_ALL_BOOKS", embeddings, allow_dangerous_deserialization=True)  # Load the previously saved vector db
-    # mq_retriever = MultiQueryRetriever.from_llm(retriever = new_db.as_retriever(search_kwargs={'k': 5}), llm = model )
-    # docs1 = mq_retriever.get_relevant_documents(query=user_question)
-    docs1 = new_db.similarity_search(user_question , k = 6)
-    questions_db = FAISS.load_local('FAISS_INDEX_Questions' , embeddings , allow_dangerous_deserialization=True)
-    suggested_questions = questions_db.similarity_search(query=user_question, k = 5)
-    response = chain({"input_documents": docs1, "question": user_question}, return_only_outputs=True)
-    return response , docs1 , suggested_questions
 
-def user_input1(user_question):
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    prompt_template = """
-    Answer the question from the context provided.Explain in as much details as possible.
-    Context:\n{context}?\n
-    Question:\n{question} + Explain in detail .\n
-    Answer:
+# Embedding backend: "google" (EMBEDDING_MODEL over the API) or "local" (a static
+# embedding model read from LOCAL_EMBEDDING_MODEL_PATH, see embedding_backends).
+# Indexes record the backend they were built with and refuse to load with another one.
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "google")
+EMBEDDING_MODEL = "models/embedding-001"
+LOCAL_EMBEDDING_MODEL_PATH = os.environ.get("LOCAL_EMBEDDING_MODEL_PATH", "models/static_embeddings.npz")
+EMBEDDING_THREADS = int(os.environ.get("EMBEDDING_THREADS", "4"))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+
+ALL_BOOKS_INDEX = "FAISS_INDEX_ALL_BOOKS"
+QUESTIONS_INDEX = "FAISS_INDEX_Questions"
+DEFAULT_K = 6
+SUGGESTED_QUESTIONS_K = 5
+# Hard ceiling on the retrieved context sent to the model, after compression.
+CONTEXT_MAX_TOKENS = 1500
+# How long retrieval waits for the question embedding before answering from BM25 alone.
+EMBEDDING_TIMEOUT_SECONDS = 3.0
+
+# Books that can be chatted with individually, keyed by the name used in the UI.
+# "name" is the book's 'book' metadata in the combined index (the PDF name without '.pdf').
+# "index" is the legacy per-book index, only used while ALL_BOOKS_INDEX has no metadata.
+BOOKS = {
+    "The Smart Branding Book": {"name": "The Smart Branding Book", "index": "FAISS_INDEX_The_Smart_Branding_Book", "k": 3},
+    "The Smart Marketing Book": {"name": "The Smart Marketing Book v24 PDF", "index": "FAISS_INDEX_The_Smart_Marketing_Book_v24", "k": 3},
+    "The Smart Advertising Book": {"name": "The Smart Advertising Book FINAL v2 PDF", "index": "FAISS_INDEX_The_Smart_Advertising_Book_FINAL_v2", "k": 3},
+    "The Soft Skills Book": {"name": "The Soft Skills Book PDF", "index": "FAISS_INDEX_The_Soft_Skills_Book", "k": 3},
+}
+
+# Answers keyed on book selection + question embedding, shared by all worker processes.
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", "answer_cache.sqlite")
+ANSWER_CACHE_MAX_DISTANCE = 0.05
+answer_cache = AnswerCache(ANSWER_CACHE_PATH, max_distance=ANSWER_CACHE_MAX_DISTANCE)
+
+# Questions shown as buttons in the app sidebar.
+POPULAR_QUESTIONS = [
+    "What is Branding ?",
+    "How does a brand grows ?",
+    "Who is responsible for branding ?",
+    "What is the impact of brand building on demand curve ?",
+    "Explain Brand Value Growth Matrix .",
+]
+
+# Answers to POPULAR_QUESTIONS and the FAISS_INDEX_Questions questions, generated ahead
+# of time for every selection in PRECOMPUTE_SELECTIONS (all books, then each book alone).
+PRECOMPUTED_ANSWERS_PATH = os.environ.get("PRECOMPUTED_ANSWERS_PATH", "precomputed_answers.sqlite")
+PRECOMPUTE_SELECTIONS = [None] + [[book] for book in BOOKS]
+precomputed_answers = PrecomputedAnswers(PRECOMPUTED_ANSWERS_PATH)
+
+# Shared pool for running the vector and BM25 searches side by side.
+search_pool = ThreadPoolExecutor(max_workers=8)
+# Embedding calls get their own pool: calls hung on the API must not starve the BM25 fallback.
+embedding_pool = ThreadPoolExecutor(max_workers=4)
+
+@lru_cache(maxsize=None)
+def get_embeddings():
     """
-    model = ChatGoogleGenerativeAI(model="gemini-1.0-pro", temperature=0.5)
-    # repo_id="mistralai/Mistral-7B-Instruct-v0.2"
-    # model=HuggingFaceEndpoint(repo_id=repo_id,max_length=128,temperature=0.7,token=sec_key)
-    prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-    chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
-      # Model for creating vector embeddings
-    new_db = FAISS.load_local("FAISS_INDEX_The_Smart_Branding_Book", embeddings, allow_dangerous_deserialization=True)  # Load the previously saved vector db
-    # mq_retriever = MultiQueryRetriever.from_llm(retriever = new_db.as_retriever(search_kwargs={'k': 5}), llm = model )
-    # docs1 = mq_retriever.get_relevant_documents(query=user_question)
-    docs1 = new_db.similarity_search(user_question , k = 3)
-    questions_db = FAISS.load_local('FAISS_INDEX_Questions' , embeddings , allow_dangerous_deserialization=True)
-    suggested_questions = questions_db.similarity_search(query=user_question, k = 5)
-    response = chain({"input_documents": docs1, "question": user_question}, return_only_outputs=True)
-    return response , docs1 , suggested_questions
+    Returns the process-wide embeddings client, built once and shared by every session.
+    Remote vectors are cached in memory and in EMBEDDING_CACHE_PATH, so a text is embedded once.
+    The local backend is faster than a cache lookup and is used directly.
+    """
+    if EMBEDDING_BACKEND == "local":
+        return create_backend("local", LOCAL_EMBEDDING_MODEL_PATH, threads=EMBEDDING_THREADS)
+    backend = create_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL)
+    return CachedEmbeddings(backend, path=EMBEDDING_CACHE_PATH, model_name=embedding_spec(backend)["model"])
 
-def user_input2(user_question):
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    prompt_template = """
-    Answer the question from the context provided.Explain in as much details as possible.
-    Context:\n{context}?\n
-    Question:\n{question} + Explain in detail .\n
-    Answer:
+@lru_cache(maxsize=None)
+def get_chat_model():
     """
-    model = ChatGoogleGenerativeAI(model="gemini-1.0-pro", temperature=0.5)
-    # repo_id="mistralai/Mistral-7B-Instruct-v0.2"
-    # model=HuggingFaceEndpoint(repo_id=repo_id,max_length=128,temperature=0.7,token=sec_key)
-    prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-    chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
-      # Model for creating vector embeddings
-    new_db = FAISS.load_local("FAISS_INDEX_The_Smart_Advertising_Book_FINAL_v2", embeddings, allow_dangerous_deserialization=True)  # Load the previously saved vector db
-    # mq_retriever = MultiQueryRetriever.from_llm(retriever = new_db.as_retriever(search_kwargs={'k': 5}), llm = model )
-    # docs1 = mq_retriever.get_relevant_documents(query=user_question)
-    docs1 = new_db.similarity_search(user_question , k = 3)
-    questions_db = FAISS.load_local('FAISS_INDEX_Questions' , embeddings , allow_dangerous_deserialization=True)
-    suggested_questions = questions_db.similarity_search(query=user_question, k = 5)
-    response = chain({"input_documents": docs1, "question": user_question}, return_only_outputs=True)
-    return response , docs1 ,suggested_questions
-
-def user_input3(user_question):
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    prompt_template = """
-    Answer the question from the context provided.Explain in as much details as possible.
-    Context:\n{context}?\n
-    Question:\n{question} + Explain in detail .\n
-    Answer:
+    Returns the process-wide chat model, built once and shared by every session.
     """
-    model = ChatGoogleGenerativeAI(model="gemini-1.0-pro", temperature=0.5)
     # repo_id="mistralai/Mistral-7B-Instruct-v0.2"
     # model=HuggingFaceEndpoint(repo_id=repo_id,max_length=128,temperature=0.7,token=sec_key)
-    prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-    chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
-      # Model for creating vector embeddings
-    new_db = FAISS.load_local("FAISS_INDEX_The_Smart_Marketing_Book_v24", embeddings, allow_dangerous_deserialization=True)  # Load the previously saved vector db
+    return ChatGoogleGenerativeAI(model="gemini-1.0-pro", temperature=0.5)
+
+@lru_cache(maxsize=None)
+def get_prompt():
+    return PromptTemplate(template=PROMPT_TEMPLATE, input_variables=["context", "question"])
+
+@lru_cache(maxsize=None)
+def get_qa_chain():
+    """
+    Returns the process-wide "stuff" QA chain, built once and shared by every session.
+    """
+    return load_qa_chain(get_chat_model(), chain_type="stuff", prompt=get_prompt())
+
+def load_index(index_dir):
+    """
+    Returns the FAISS index saved in `index_dir` from the process-wide registry.
+    The index is deserialized once and reloaded only when its files change on disk.
+    """
+    return registry.get_index(index_dir, get_embeddings())
+
+def extract_text_from_pdf(pdf_path, first_page=6, last_page=29, dpi=300, workers=None):
+    """
+    Extracts a page range of a PDF and returns the text of every page, prefixed with its number.
+    The PDF text layer is used where it has usable text; other pages are OCRed in parallel.
+    """
+    parts = []
+    for page in extract_pages(pdf_path, first_page=first_page, last_page=last_page, dpi=dpi, workers=workers):
+        parts.append(f"Page Number : {page.page_number} \n\n{page.text}\n")
+    return "".join(parts)
+
+def get_text_chunks(text, target_tokens=DEFAULT_TARGET_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    return chunk_text(text, target_tokens, overlap_tokens)
+
+def get_vector_store(text_chunks, batch_size=100, index_dir="Faiss_Index_BOOK1", metadatas=None,
+                     index_type="flat", index_params=None, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                     tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Builds or incrementally updates `index_dir` from the text chunks.
+    Chunks whose text is already in the index are not embedded again.
+    `index_type` selects an exact ('flat') or approximate ('hnsw', 'ivf', 'ivfpq') index.
+    The embedding calls stay within `requests_per_minute` and `tokens_per_minute`, with
+    up to `concurrency` calls in flight.
+    Chunks are keyed on their content, so a repeated text is indexed once, with the
+    metadata of its first occurrence.
+    """
+    first = {}
+    for position, text in enumerate(text_chunks):
+        first.setdefault(text, position)
+    text_chunks = list(first)
+    if metadatas is not None:
+        metadatas = [metadatas[position] for position in first.values()]
+    vector_store, _ = update_index(index_dir, text_chunks, get_embeddings(), metadatas=metadatas, batch_size=batch_size,
+                                   index_type=index_type, index_params=index_params,
+                                   requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                                   concurrency=concurrency)
+    return vector_store
+
+def create_embeddings(pdf_path='The Smart Branding Book.pdf', index_dir="Faiss_Index_BOOK1"):
+    # Chunk each page separately to a token budget, keeping book and page on every chunk
+    book_name = Path(pdf_path).stem
+    pages = [
+        Document(page_content=page.text, metadata={"book": book_name, "page": page.page_number, "source": pdf_path})
+        for page in extract_pages(pdf_path, first_page=6, last_page=29)
+    ]
+    chunks = chunk_documents(pages)
+    get_vector_store([chunk.page_content for chunk in chunks], index_dir=index_dir,
+                     metadatas=[chunk.metadata for chunk in chunks])
+    save_chunk_stats(index_dir, chunk_stats(chunks), DEFAULT_TARGET_TOKENS, DEFAULT_OVERLAP_TOKENS)
+
+def normalize_books(books=None):
+    """
+    Returns the selected BOOKS keys as a list, or None when every book is selected.
+    Accepts a single book name, a list of names, or None.
+    """
+    if isinstance(books, str):
+        books = [books]
+    if not books or set(books) == set(BOOKS):
+        return None
+    return [book for book in BOOKS if book in books]
+
+def resolve_k(books=None, k=None):
+    if k is not None:
+        return k
+    books = normalize_books(books)
+    return BOOKS[books[0]]["k"] if books and len(books) == 1 else DEFAULT_K
+
+def cache_selection(books=None, k=None):
+    """
+    Returns the answer-cache key for a book selection, retrieval depth and embedding model.
+    """
+    selected = normalize_books(books)
+    # Vectors of different embedding models must never be compared in the answer cache
+    model = embedding_spec(get_embeddings())["model"]
+    return f"{'+'.join(selected) if selected else 'ALL_BOOKS'}|k={resolve_k(books, k)}|{model}"
+
+def load_lexical_index(index_dir):
+    """
+    Returns the BM25 index saved next to the FAISS index in `index_dir`, or None for
+    indexes built before BM25 indexes were saved.
+    """
+    path = lexical_index_path(index_dir)
+    if not os.path.exists(path):
+        return None
+    return registry.get(path, BM25Index.load)
+
+def lookup_neighbors(user_question):
+    """
+    Returns the precomputed similar questions of a question from the questions index as
+    Documents, or None for a free-text question (or when neighbors.json was not built).
+    """
+    path = os.path.join(QUESTIONS_INDEX, NEIGHBORS_NAME)
+    if not os.path.exists(path):
+        return None
+    neighbors = registry.get(path, load_neighbors).get(user_question.strip())
+    if neighbors is None:
+        return None
+    return [Document(page_content=question) for question in neighbors[:SUGGESTED_QUESTIONS_K]]
+
+def embed_questions(user_questions):
+    """
+    Embeds many questions in one batch with `CachedEmbeddings.embed_queries`. Embeddings
+    without it (plain LangChain embeddings, the offline stubs) embed them with `embed_documents`.
+    """
+    embeddings = get_embeddings()
+    embed_queries = getattr(embeddings, "embed_queries", None)
+    if embed_queries is None:
+        return embeddings.embed_documents(user_questions)
+    return embed_queries(user_questions)
+
+def embed_question(user_question, timeout=EMBEDDING_TIMEOUT_SECONDS):
+    """
+    Embeds a question, giving up after `timeout` seconds.
+    Returns None on timeout; the call still finishes in the background and fills the embedding cache.
+    """
+    future = embedding_pool.submit(get_embeddings().embed_query, user_question)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        print(f"Embedding timed out after {timeout}s, retrieving with BM25 only")
+        return None
+
+def search_targets(books=None):
+    """
+    Returns (index_dir, book names) pairs to search for a book selection.
+    Book names restrict a search on the combined index; None searches the whole index.
+
+    The combined index is only used once its documents carry 'book' metadata; until
+    then it is not a book index at all, and every selection, including all books,
+    searches the per-book indexes.
+    """
+    books = normalize_books(books)
+    if has_book_metadata(load_index(ALL_BOOKS_INDEX)):
+        if books is None:
+            return [(ALL_BOOKS_INDEX, None)]
+        # Per-book queries are served from the combined index, restricted to the books' pages
+        return [(ALL_BOOKS_INDEX, [BOOKS[book]["name"] for book in books])]
+    return [(BOOKS[book]["index"], None) for book in books or BOOKS]
+
+def start_lexical_search(user_question, books=None, k=None):
+    """
+    Starts the BM25 searches for a question on the search pool.
+
+    Returns:
+        tuple: (docs_futures, questions_future). Indexes without a BM25 index are skipped,
+        and questions_future is None when the questions index has none or the question
+        is a known one (see `lookup_neighbors`).
+    """
+    k = resolve_k(books, k)
+    docs_futures = []
+    for index_dir, names in search_targets(books):
+        bm25 = load_lexical_index(index_dir)
+        if bm25 is not None:
+            docs_futures.append(search_pool.submit(lexical_search, load_index(index_dir), bm25, user_question, k, names))
+    questions_bm25 = load_lexical_index(QUESTIONS_INDEX)
+    questions_future = None
+    if questions_bm25 is not None and lookup_neighbors(user_question) is None:
+        questions_future = search_pool.submit(
+            lexical_search, load_index(QUESTIONS_INDEX), questions_bm25, user_question, SUGGESTED_QUESTIONS_K
+        )
+    return docs_futures, questions_future
+
+def retrieve(user_question, books=None, k=None, query_vector=None, lexical=None, embed=True):
+    """
+    Retrieves the pages and suggested questions for a question.
+
+    The question is embedded once and the same vector is used for every search. When
+    the combined index carries book metadata, any subset of books is served by one
+    filtered search on it. Otherwise the selected per-book indexes are searched in
+    parallel and merged into one global top-k by score. The suggested-questions search
+    runs alongside, except for questions of the questions index, whose similar
+    questions are read from the precomputed neighbor table.
+
+    Local BM25 searches run concurrently with the embedding call and the vector
+    searches, and both rankings are combined by reciprocal rank fusion. If the
+    embedding does not arrive within EMBEDDING_TIMEOUT_SECONDS, the BM25 results are
+    returned on their own.
+
+    Args:
+        user_question (str): The user's question.
+        books (list): BOOKS keys to search (a single name is accepted), or None for all books.
+        k (int): Number of pages to retrieve. Defaults to the book's k, or DEFAULT_K.
+        query_vector (list): Embedding of the question, if the caller already has it.
+        lexical (tuple): Futures from `start_lexical_search`, if the caller already started it.
+        embed (bool): Embed the question when `query_vector` is None. False retrieves with
+            BM25 only, for callers whose embedding call already timed out.
+
+    Returns:
+        tuple: (docs, suggested_questions) as lists of Documents.
+    """
+    k = resolve_k(books, k)
+    if lexical is None:
+        lexical = start_lexical_search(user_question, books, k)
     # mq_retriever = MultiQueryRetriever.from_llm(retriever = new_db.as_retriever(search_kwargs={'k': 5}), llm = model )
     # docs1 = mq_retriever.get_relevant_documents(query=user_question)
-    docs1 = new_db.similarity_search(user_question , k = 3)
-    questions_db = FAISS.load_local('FAISS_INDEX_Questions' , embeddings , allow_dangerous_deserialization=True)
-    suggested_questions = questions_db.similarity_search(query=user_question, k = 5)
-    response = chain({"input_documents": docs1, "question": user_question}, return_only_outputs=True)
+    if query_vector is None and embed:
+        query_vector = embed_question(user_question)
+
+    lexical_docs_futures, lexical_questions_future = lexical
+    lexical_docs = merge_results([future.result() for future in lexical_docs_futures], k, higher_is_better=True)
+    lexical_questions = lexical_questions_future.result() if lexical_questions_future is not None else []
+    neighbors = lookup_neighbors(user_question)
+    question_results = lexical_questions
+    if query_vector is None:
+        docs = lexical_docs
+    else:
+        targets = [(load_index(index_dir), names) for index_dir, names in search_targets(books)]
+        docs_futures = [search_pool.submit(search_by_vector, store, query_vector, k, names) for store, names in targets]
+        questions_future = None
+        if neighbors is None:
+            questions_db = load_index(QUESTIONS_INDEX)
+            questions_future = search_pool.submit(questions_db.similarity_search_with_score_by_vector, query_vector,
+                                                  k=SUGGESTED_QUESTIONS_K)
+        vector_docs = merge_results([future.result() for future in docs_futures], k, higher_is_better(targets[0][0]))
+        docs = reciprocal_rank_fusion([vector_docs, lexical_docs], k)
+        if questions_future is not None:
+            question_results = reciprocal_rank_fusion([questions_future.result(), lexical_questions], SUGGESTED_QUESTIONS_K)
+
+    if neighbors is not None:
+        return [doc for doc, _ in docs], neighbors
+    return [doc for doc, _ in docs], [doc for doc, _ in question_results]
+
+def retrieve_many(user_questions, query_vectors, books=None, k=None):
+    """
+    Batched `retrieve` for many questions against the same book selection.
+
+    Each index is searched once with the matrix of all question vectors instead of once
+    per question. The BM25 searches, the fusion and the neighbor table lookup are the
+    same as in `retrieve`.
+
+    Args:
+        user_questions (list): The questions.
+        query_vectors (list): One embedding per question.
+        books (list): BOOKS keys to search, or None for all books.
+        k (int): Number of pages to retrieve per question.
+
+    Returns:
+        list: One (docs, suggested_questions) tuple per question.
+    """
+    k = resolve_k(books, k)
+    targets = [(load_index(index_dir), names, load_lexical_index(index_dir)) for index_dir, names in search_targets(books)]
+    questions_db = load_index(QUESTIONS_INDEX)
+    questions_bm25 = load_lexical_index(QUESTIONS_INDEX)
+    vector_hits = [search_by_vectors(store, query_vectors, k, names) for store, names, _ in targets]
+    question_hits = search_by_vectors(questions_db, query_vectors, SUGGESTED_QUESTIONS_K)
+
+    results = []
+    for i, user_question in enumerate(user_questions):
+        vector_docs = merge_results([hits[i] for hits in vector_hits], k, higher_is_better(targets[0][0]))
+        lexical_docs = merge_results(
+            [lexical_search(store, bm25, user_question, k, names) for store, names, bm25 in targets if bm25 is not None],
+            k, higher_is_better=True,
+        )
+        docs = reciprocal_rank_fusion([vector_docs, lexical_docs], k)
+        neighbors = lookup_neighbors(user_question)
+        if neighbors is None:
+            lexical_questions = []
+            if questions_bm25 is not None:
+                lexical_questions = lexical_search(questions_db, questions_bm25, user_question, SUGGESTED_QUESTIONS_K)
+            questions = reciprocal_rank_fusion([question_hits[i], lexical_questions], SUGGESTED_QUESTIONS_K)
+            neighbors = [doc for doc, _ in questions]
+        results.append(([doc for doc, _ in docs], neighbors))
+    return results
+
+def answer_from_docs(user_question, docs):
+    """
+    Compresses the retrieved docs into the context and runs the QA chain.
+    Returns the chain output dict.
+    """
+    context_docs = compress_documents(user_question, docs, CONTEXT_MAX_TOKENS)
+    return get_qa_chain()({"input_documents": context_docs, "question": user_question}, return_only_outputs=True)
+
+def user_input(user_question, books=None, k=None):
+    """
+    Answers a question from the selected books (or from all books when `books` is None).
+
+    Args:
+        user_question (str): The user's question.
+        books (list): BOOKS keys to search (a single name is accepted), or None for all books.
+        k (int): Number of pages to retrieve. Defaults to the book's k, or DEFAULT_K.
+
+    Returns:
+        tuple: (response, docs, suggested_questions) where response is the QA chain output.
+    """
+    precomputed = lookup_precomputed(user_question, books, k)
+    if precomputed is not None:
+        return {"output_text": precomputed.answer}, precomputed.docs, precomputed.suggested_questions
+    query_vector = embed_question(user_question)
+    selection = cache_selection(books, k)
+    cached = answer_cache.lookup(selection, query_vector) if query_vector is not None else None
+    if cached is not None:
+        return {"output_text": cached.answer}, cached.docs, cached.suggested_questions
+    docs1, suggested_questions = retrieve(user_question, books=books, k=k, query_vector=query_vector, embed=False)
+    response = answer_from_docs(user_question, docs1)
+    if query_vector is not None:
+        answer_cache.store(selection, user_question, query_vector, response["output_text"], docs1, suggested_questions)
     return response , docs1 , suggested_questions
 
-def user_input4(user_question):
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    prompt_template = """
-    Answer the question from the context provided.Explain in as much details as possible.
-    Context:\n{context}?\n
-    Question:\n{question} + Explain in detail .\n
-    Answer:
+class AnswerStream:
     """
-    model = ChatGoogleGenerativeAI(model="gemini-1.0-pro", temperature=0.5)
-    # repo_id="mistralai/Mistral-7B-Instruct-v0.2"
-    # model=HuggingFaceEndpoint(repo_id=repo_id,max_length=128,temperature=0.7,token=sec_key)
-    prompt = PromptTemplate(template=prompt_template, input_variables=["context", "question"])
-    chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
-      # Model for creating vector embeddings
-    new_db = FAISS.load_local("FAISS_INDEX_The_Soft_Skills_Book", embeddings, allow_dangerous_deserialization=True)  # Load the previously saved vector db
-    # mq_retriever = MultiQueryRetriever.from_llm(retriever = new_db.as_retriever(search_kwargs={'k': 5}), llm = model )
-    # docs1 = mq_retriever.get_relevant_documents(query=user_question)
-    docs1 = new_db.similarity_search(user_question , k = 3)
-    questions_db = FAISS.load_local('FAISS_INDEX_Questions' , embeddings , allow_dangerous_deserialization=True)
-    suggested_questions = questions_db.similarity_search(query=user_question, k = 5)
-    response = chain({"input_documents": docs1, "question": user_question}, return_only_outputs=True)
-    return response , docs1,suggested_questions
+    Iterable over the text chunks of a streamed answer.
+
+    Collects the full answer while it is consumed and measures the time to the first
+    token and the total time, both counted from when the request started.
+
+    Attributes:
+        text (str): The answer streamed so far (the full answer once exhausted).
+        time_to_first_token (float): Seconds until the first non-empty chunk, or None.
+        total_seconds (float): Seconds until the stream ended, or None while streaming.
+    """
+
+    def __init__(self, chunks, started, on_complete=None):
+        self._chunks = chunks
+        self._parts = []
+        self._on_complete = on_complete
+        self.started = started
+        self.time_to_first_token = None
+        self.total_seconds = None
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.perf_counter() - self.started
+            self._parts.append(chunk)
+            yield chunk
+        self.total_seconds = time.perf_counter() - self.started
+        print(f"Answer streamed: first token {self.time_to_first_token}s, total {self.total_seconds:.2f}s")
+        if self._on_complete is not None and self._parts:
+            self._on_complete(self.text)
+
+def stream_user_input(user_question, books=None, k=None):
+    """
+    Streaming variant of `user_input`: retrieval runs up front, generation is streamed.
+
+    The prompt is the same one the "stuff" QA chain builds, sent to the chat model's
+    token stream instead of waiting for the whole answer.
+
+    Args:
+        user_question (str): The user's question.
+        books (list): BOOKS keys to search (a single name is accepted), or None for all books.
+        k (int): Number of pages to retrieve. Defaults to the book's k, or DEFAULT_K.
+
+    Returns:
+        tuple: (answer_stream, docs, suggested_questions) where answer_stream is an AnswerStream.
+    """
+    started = time.perf_counter()
+    precomputed = lookup_precomputed(user_question, books, k)
+    if precomputed is not None:
+        return AnswerStream(iter([precomputed.answer]), started), precomputed.docs, precomputed.suggested_questions
+    query_vector = embed_question(user_question)
+    selection = cache_selection(books, k)
+    cached = answer_cache.lookup(selection, query_vector) if query_vector is not None else None
+    if cached is not None:
+        return AnswerStream(iter([cached.answer]), started), cached.docs, cached.suggested_questions
+
+    docs1, suggested_questions = retrieve(user_question, books=books, k=k, query_vector=query_vector, embed=False)
+    context = "\n\n".join(doc.page_content for doc in compress_documents(user_question, docs1, CONTEXT_MAX_TOKENS))
+    prompt = get_prompt().format(context=context, question=user_question)
+    chunks = (chunk.content for chunk in get_chat_model().stream(prompt))
+
+    def on_complete(answer):
+        if query_vector is not None:
+            answer_cache.store(selection, user_question, query_vector, answer, docs1, suggested_questions)
+
+    return AnswerStream(chunks, started, on_complete), docs1, suggested_questions
+
+def precompute_fingerprint():
+    """
+    Returns the fingerprint of every index a precomputed answer can come from: the
+    questions index and the indexes `search_targets` searches for PRECOMPUTE_SELECTIONS.
+    Per-book indexes count only while the combined index has no book metadata.
+    """
+    index_dirs = {index_dir for books in PRECOMPUTE_SELECTIONS for index_dir, _ in search_targets(books)}
+    return index_fingerprint([QUESTIONS_INDEX] + sorted(index_dirs))
+
+def known_questions():
+    """
+    Returns POPULAR_QUESTIONS followed by every question of the questions index, without repeats.
+    """
+    questions_db = load_index(QUESTIONS_INDEX)
+    indexed = (questions_db.docstore.search(doc_id) for doc_id in questions_db.index_to_docstore_id.values())
+    questions = POPULAR_QUESTIONS + [doc.page_content.strip() for doc in indexed if not isinstance(doc, str)]
+    return list(dict.fromkeys(questions))
+
+def precompute_answers(selections=None, questions=None, force=False, concurrency=4, requests_per_minute=60):
+    """
+    Answers the known questions for every book selection and stores the results.
+
+    Only missing or stale answers (generated from indexes that have since been
+    rebuilt) are generated, unless `force` is set. A full run (default selections and
+    questions) without failures deletes the stale answers afterwards. Questions are embedded in one batch
+    and searched with one matrix query per selection; generation runs on `concurrency`
+    threads under a token bucket. The most relevant page's display image is rendered
+    so it is on disk when the answer is served.
+
+    Args:
+        selections (list): Book selections (None or a list of BOOKS keys). Defaults to PRECOMPUTE_SELECTIONS.
+        questions (list): Questions to answer. Defaults to `known_questions()`.
+        force (bool): Regenerate answers that are still fresh.
+        concurrency (int): Number of generation threads.
+        requests_per_minute (float): Rate limit for the chat model.
+
+    Returns:
+        dict: Number of answers generated and failed, and the store statistics.
+    """
+    fingerprint = precompute_fingerprint()
+    full_run = selections is None and questions is None
+    questions = questions or known_questions()
+    vectors = []
+    for i in range(0, len(questions), 100):
+        vectors.extend(embed_questions(questions[i:i + 100]))
+    bucket = TokenBucket(requests_per_minute / 60.0, capacity=concurrency)
+    report = {"generated": 0, "failed": 0}
+
+    def generate(user_question, docs):
+        bucket.acquire()
+        return answer_from_docs(user_question, docs)["output_text"]
+
+    for books in selections or PRECOMPUTE_SELECTIONS:
+        selection = cache_selection(books)
+        todo = [i for i, question in enumerate(questions)
+                if force or precomputed_answers.lookup(selection, question, fingerprint) is None]
+        if not todo:
+            continue
+        retrieved = retrieve_many([questions[i] for i in todo], [vectors[i] for i in todo], books=books)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(generate, questions[i], docs) for i, (docs, _) in zip(todo, retrieved)]
+            for i, (docs, suggested_questions), future in zip(todo, retrieved, futures):
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    report["failed"] += 1
+                    print(f"Precompute failed for {questions[i]!r} ({selection}): {e}")
+                    continue
+                book = docs[0].metadata.get("book") if docs else None
+                page = docs[0].metadata.get("page") if docs else None
+                image_path = get_page_image_path(book, page)
+                if image_path is not None:
+                    get_display_image(book, page)
+                precomputed_answers.store(selection, questions[i], answer, docs, suggested_questions,
+                                          book, page, image_path, fingerprint)
+                report["generated"] += 1
+        print(f"Precomputed {len(todo)} answers for {selection}")
+    if full_run and report["failed"] == 0:
+        # Every known answer is now fresh; stale rows are never served, and keeping them
+        # would leave has_stale true and send every cache miss through claim_regeneration
+        report["deleted"] = precomputed_answers.delete_stale(fingerprint)
+    report.update(precomputed_answers.stats(fingerprint))
+    return report
+
+def _regenerate(fingerprint):
+    succeeded = False
+    try:
+        report = precompute_answers()
+        succeeded = report["failed"] == 0
+    except Exception as e:
+        print(f"Regenerating precomputed answers failed: {e}")
+    finally:
+        precomputed_answers.finish_regeneration(fingerprint, succeeded)
+
+def _regenerate_in_background(fingerprint):
+    # One regeneration per index fingerprint across every process sharing the store;
+    # a failed run is retried after REGENERATION_RETRY_SECONDS
+    if precomputed_answers.claim_regeneration(fingerprint):
+        threading.Thread(target=_regenerate, args=(fingerprint,), daemon=True, name="precompute-answers").start()
+
+def lookup_precomputed(user_question, books=None, k=None):
+    """
+    Returns the precomputed answer for exactly this question and book selection, or None.
+
+    When stored answers come from indexes that have since been rebuilt, one serving
+    process regenerates them in a background thread and live answers are served until then.
+    """
+    fingerprint = precompute_fingerprint()
+    answer = precomputed_answers.lookup(cache_selection(books, k), user_question, fingerprint)
+    if answer is None and precomputed_answers.has_stale(fingerprint):
+        _regenerate_in_background(fingerprint)
+    return answer
 
 def main():
     create_embeddings()
@@ -0,0 +1,99 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+
+def page_count(pdf_path):
+    """
+    Returns the number of pages in a PDF without rendering it.
+    """
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def ocr_page_range(pdf_path, first_page, last_page, dpi=300):
+    """
+    Renders and OCRs one small range of pages.
+
+    Only the pages in the range are rasterized, so a worker holds at most
+    `last_page - first_page + 1` page images at a time. Pages that fail to render get
+    an empty text, so every page in the range is returned.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        first_page (int): First page to OCR (1-based, inclusive).
+        last_page (int): Last page to OCR (1-based, inclusive).
+        dpi (int): Rendering resolution.
+
+    Returns:
+        list: (page_number, text) tuples in page order.
+    """
+    images = convert_from_path(pdf_path, dpi, first_page=first_page, last_page=last_page)
+    expected = last_page - first_page + 1
+    if len(images) != expected:
+        print(f"Rendered {len(images)} of {expected} pages {first_page}-{last_page} of {pdf_path}")
+    results = []
+    for offset, image in enumerate(images[:expected]):
+        results.append((first_page + offset, pytesseract.image_to_string(image)))
+        image.close()
+    for page_number in range(first_page + len(results), last_page + 1):
+        results.append((page_number, ""))
+    return results
+
+
+def page_ranges(page_numbers, pages_per_task):
+    """
+    Groups sorted page numbers into (first_page, last_page) runs of consecutive pages,
+    at most `pages_per_task` long, so only the listed pages are ever rendered.
+    """
+    ranges = []
+    for page_number in page_numbers:
+        if ranges and page_number == ranges[-1][1] + 1 and page_number - ranges[-1][0] < pages_per_task:
+            ranges[-1][1] = page_number
+        else:
+            ranges.append([page_number, page_number])
+    return [tuple(page_range) for page_range in ranges]
+
+
+def iter_ocr_pages(pdf_path, first_page=1, last_page=None, dpi=300, pages_per_task=4, workers=None, page_numbers=None):
+    """
+    OCRs a PDF across a process pool and yields (page_number, text) in page order.
+
+    Pages are rendered in ranges of `pages_per_task` inside the workers, and only a
+    bounded number of ranges is in flight at once, so peak memory stays flat however
+    long the book is.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        first_page (int): First page to OCR (1-based, inclusive).
+        last_page (int): Last page to OCR (1-based, inclusive), clamped to the page count.
+            Defaults to the last page.
+        dpi (int): Rendering resolution.
+        pages_per_task (int): Pages rendered and OCRed per worker task.
+        workers (int): Number of processes. Defaults to the available cores.
+        page_numbers (list): OCR only these pages (1-based) instead of the whole range.
+
+    Yields:
+        tuple: (page_number, text) for every page in the range (or in `page_numbers`).
+    """
+    if page_numbers is None:
+        total_pages = page_count(pdf_path)
+        last_page = total_pages if last_page is None else min(last_page, total_pages)
+        page_numbers = range(first_page, last_page + 1)
+    ranges = deque(page_ranges(sorted(page_numbers), pages_per_task))
+    if not ranges:
+        return
+    workers = min(workers or os.cpu_count() or 1, len(ranges))
+    max_in_flight = workers * 2
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < max_in_flight:
+                start, end = ranges.popleft()
+                in_flight.append(pool.submit(ocr_page_range, pdf_path, start, end, dpi))
+            # Results are consumed in submission order so pages come out in order
+            for page in in_flight.popleft().result():
+                yield page
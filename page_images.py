@@ -0,0 +1,115 @@
+import io
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+
+from PIL import Image
+
+IMAGE_DIR = "converted_images"
+MANIFEST_PATH = os.path.join(IMAGE_DIR, "manifest.json")
+DISPLAY_DIR = os.path.join(IMAGE_DIR, "display")
+DISPLAY_WIDTH = 800
+DISPLAY_QUALITY = 80
+
+_FILENAME_PATTERN = re.compile(r"^(?P<book>.+)_page_(?P<page>\d+)_image_(?P<index>\d+)\.png$")
+
+_lock = threading.Lock()
+_manifest = {"signature": None, "pages": {}}
+
+
+def _signature():
+    # The directory mtime changes whenever an image is added or removed
+    paths = [IMAGE_DIR, MANIFEST_PATH]
+    return tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None for path in paths)
+
+
+def _build_page_map():
+    """
+    Maps (book, page) to the first image of that page.
+
+    Uses the manifest written by `parsing_images.extract_images` when there is one and
+    otherwise scans the image directory once.
+    """
+    pages = {}
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            entries = json.load(f)["images"]
+        placements = [(e["book"], int(e["page"]), int(e["index"]), e["file"]) for e in entries]
+    else:
+        placements = []
+        with os.scandir(IMAGE_DIR) as it:
+            for entry in it:
+                match = _FILENAME_PATTERN.match(entry.name)
+                if match:
+                    placements.append((match["book"], int(match["page"]), int(match["index"]), entry.name))
+
+    for book, page, index, filename in sorted(placements):
+        pages.setdefault((book, page), os.path.join(IMAGE_DIR, filename))
+    return pages
+
+
+def get_page_image_map():
+    """
+    Returns the cached (book, page) -> image path map, rebuilt only when the images change.
+    """
+    signature = _signature()
+    with _lock:
+        if _manifest["signature"] != signature:
+            _manifest["pages"] = _build_page_map() if os.path.isdir(IMAGE_DIR) else {}
+            _manifest["signature"] = signature
+        return _manifest["pages"]
+
+
+def get_page_image_path(book_name, page_number):
+    """
+    Returns the path of the image shown for a page, or None when the page has no image.
+    """
+    if book_name is None or page_number is None:
+        return None
+    return get_page_image_map().get((book_name, int(page_number)))
+
+
+@lru_cache(maxsize=256)
+def _display_bytes(image_path, mtime_ns, width):
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    display_path = os.path.join(DISPLAY_DIR, f"{stem}_{width}.jpg")
+    if os.path.exists(display_path) and os.stat(display_path).st_mtime_ns >= mtime_ns:
+        with open(display_path, "rb") as f:
+            return f.read()
+
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=DISPLAY_QUALITY, optimize=True)
+    data = buffer.getvalue()
+
+    os.makedirs(DISPLAY_DIR, exist_ok=True)
+    tmp_path = display_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, display_path)
+    return data
+
+
+def get_display_image(book_name, page_number, width=DISPLAY_WIDTH):
+    """
+    Returns display-sized JPEG bytes for a page's image, or None when the page has no image.
+
+    Derivatives are memoized in the process (shared by every session and rerun) and
+    saved under DISPLAY_DIR so they survive restarts. A manifest entry whose file is
+    missing or cannot be decoded is skipped (None), so one stale entry cannot break
+    the chat history.
+    """
+    image_path = get_page_image_path(book_name, page_number)
+    if image_path is None:
+        return None
+    try:
+        return _display_bytes(image_path, os.stat(image_path).st_mtime_ns, width)
+    except (OSError, Image.DecompressionBombError) as e:
+        # UnidentifiedImageError is an OSError
+        print(f"Skipping image {image_path}: {e}")
+        return None
@@ -0,0 +1,91 @@
+from collections import Counter, defaultdict
+
+import Levenshtein
+import pandas as pd
+
+from index_registry import registry
+
+
+def _ngrams(text, n=3):
+    padded = f"  {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class PageLookupIndex:
+    """
+    Fuzzy text -> page number lookup built once from an Excel sheet.
+
+    The lookup returns exactly the page `app.extract_relevant_page_number` used to return
+    (smallest Levenshtein distance, first row on ties) but avoids scoring every row:
+    identical texts are scored once, a trigram inverted index picks likely rows first
+    to get a tight best distance early, and the length difference, a lower bound on the
+    edit distance, prunes the remaining rows.
+
+    Args:
+        excel_sheet (str): Path to the sheet, with 'Text' and 'Page Number' columns or
+            with text and page number as the first two columns and no header.
+    """
+
+    def __init__(self, excel_sheet, candidates=20):
+        df = pd.read_excel(excel_sheet)
+        if 'Text' not in df.columns or 'Page Number' not in df.columns:
+            df = pd.read_excel(excel_sheet, header=None)
+            df.columns = ['Text', 'Page Number']
+
+        self.candidates = candidates
+        self.texts = []
+        self.pages = []
+        seen = set()
+        for text, page_number in zip(df['Text'], df['Page Number']):
+            text = str(text).strip().lower()
+            # Only the first row of a repeated text can win, so later copies are dropped
+            if text in seen:
+                continue
+            seen.add(text)
+            self.texts.append(text)
+            self.pages.append(page_number)
+
+        self.lengths = [len(text) for text in self.texts]
+        self.postings = defaultdict(list)
+        for row, text in enumerate(self.texts):
+            for gram in _ngrams(text):
+                self.postings[gram].append(row)
+
+    def lookup(self, question):
+        """
+        Returns the page number of the row most similar to `question`, or None if the sheet is empty.
+        """
+        if not self.texts:
+            return None
+        question = question.strip().lower()
+        length = len(question)
+
+        overlap = Counter()
+        for gram in _ngrams(question):
+            overlap.update(self.postings.get(gram, ()))
+        likely = [row for row, _ in overlap.most_common(self.candidates)]
+        likely_set = set(likely)
+        rest = sorted(
+            (row for row in range(len(self.texts)) if row not in likely_set),
+            key=lambda row: abs(self.lengths[row] - length),
+        )
+
+        best_distance, best_row = None, None
+        for position, row in enumerate(likely + rest):
+            bound = abs(self.lengths[row] - length)
+            if best_distance is not None and bound > best_distance:
+                if position >= len(likely):
+                    break  # `rest` is sorted by bound, nothing after this can win
+                continue
+            cutoff = best_distance if best_distance is not None else None
+            distance = Levenshtein.distance(question, self.texts[row], score_cutoff=cutoff)
+            if best_distance is None or (distance, row) < (best_distance, best_row):
+                best_distance, best_row = distance, row
+        return self.pages[best_row]
+
+
+def get_page_lookup(excel_sheet):
+    """
+    Returns the cached PageLookupIndex for `excel_sheet`, rebuilt only when the file changes.
+    """
+    return registry.get(excel_sheet, PageLookupIndex)
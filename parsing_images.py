@@ -4,14 +4,19 @@ from pathlib import Path
 from tqdm import tqdm
 from PIL import Image
 import fitz  # PyMuPDF
-from tkinter import Tk
-from tkinter.filedialog import askopenfilenames
 import io
+import json
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 # Define directories for uploaded files and converted images
 UPLOAD_DIR = Path("uploaded_files")
 CONVERTED_DIR = Path("converted_images")
 
+# Manifest of (book, page, index) -> file written by the headless extraction
+MANIFEST_PATH = CONVERTED_DIR / "manifest.json"
+
 # Create directories if they don't exist
 UPLOAD_DIR.mkdir(exist_ok=True)
 CONVERTED_DIR.mkdir(exist_ok=True)
@@ -23,6 +28,10 @@ def upload_files():
     Allows the user to select and upload multiple image and PDF files.
     Saves them to the UPLOAD_DIR.
     """
+    # Imported here so the headless extraction runs without Tk
+    from tkinter import Tk
+    from tkinter.filedialog import askopenfilenames
+
     print("Please select your image and PDF files (PNG, JPG, JPEG, PDF).")
     
     # Hide the main Tkinter window
@@ -92,6 +101,174 @@ def organize_converted_files():
     # Example implementation if needed
     pass  # Implement as per your needs
 
+# === Headless, Parallel Extraction ===
+
+def is_up_to_date(output_path, source_path):
+    """
+    Returns True when `output_path` exists and is not older than `source_path`.
+    """
+    output_path = Path(output_path)
+    return output_path.exists() and output_path.stat().st_mtime >= Path(source_path).stat().st_mtime
+
+def plan_pdf_images(pdf_path, first_page=1, last_page=None):
+    """
+    Lists every image placement in a page range without decoding any image.
+
+    Returns:
+        list: (page_number, image_index, xref) tuples, with 1-based page and image numbers.
+    """
+    pdf_document = fitz.open(pdf_path)
+    last_page = len(pdf_document) if last_page is None else min(last_page, len(pdf_document))
+    placements = []
+    for page_num in range(first_page - 1, last_page):
+        for img_index, img in enumerate(pdf_document.load_page(page_num).get_images(full=True)):
+            placements.append((page_num + 1, img_index + 1, img[0]))
+    pdf_document.close()
+    return placements
+
+def _extract_xrefs(pdf_path, jobs):
+    """
+    Worker: decodes each (xref, png_path) job once and saves it as PNG.
+    Returns the paths actually written; a failing image does not stop the others.
+    """
+    pdf_document = fitz.open(pdf_path)
+    written = []
+    for xref, png_path in jobs:
+        try:
+            base_image = pdf_document.extract_image(xref)
+            image = Image.open(io.BytesIO(base_image["image"]))
+            image.save(png_path, 'PNG')
+            written.append(png_path)
+        except Exception as e:
+            print(f"Error extracting image {xref} of {pdf_path}: {e}")
+    pdf_document.close()
+    return written
+
+def _convert_image(file_path, png_path):
+    """
+    Worker: converts one uploaded image file to PNG.
+    """
+    Image.open(file_path).convert('RGB').save(png_path, 'PNG')
+    return png_path
+
+def _link_or_copy(source, target):
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+def load_manifest():
+    if MANIFEST_PATH.exists():
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"images": []}
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_PATH.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def extract_images(files=None, page_ranges=None, workers=None, force=False, jobs_per_task=16):
+    """
+    Headless replacement for `convert_files_to_png` that runs across a process pool.
+
+    For each PDF, every unique image xref is decoded once; pages that repeat the same
+    xref (logos, recurring figures) get a hard link (or copy) of that file under their
+    own '<book>_page_<n>_image_<i>.png' name. Outputs that are newer than their source
+    file are skipped unless `force` is set. A manifest of (book, page, index) -> file is
+    written to MANIFEST_PATH: the entries of the processed pages are replaced by the
+    images that were actually written (or were already up to date), and entries of
+    other pages are kept.
+
+    Args:
+        files (list): Files to process. Defaults to everything in UPLOAD_DIR.
+        page_ranges (dict): Optional {file name: (first_page, last_page)} per PDF.
+        workers (int): Number of processes. Defaults to the available cores.
+        force (bool): Re-extract even when outputs are up to date.
+        jobs_per_task (int): Images decoded per worker task.
+
+    Returns:
+        dict: The updated manifest.
+    """
+    files = [Path(f) for f in (files or sorted(UPLOAD_DIR.iterdir()))]
+    page_ranges = page_ranges or {}
+    manifest = load_manifest()
+    processed_ranges = {}
+    entries = []
+    links = []
+    # Outputs that have to be (re)written this run, and those that were
+    pending = set()
+    written = set()
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = []
+        for file in files:
+            suffix = file.suffix.lower()
+            if suffix in ['.png', '.jpg', '.jpeg']:
+                png_path = CONVERTED_DIR / f"{file.stem}.png"
+                if force or not is_up_to_date(png_path, file):
+                    futures.append(pool.submit(_convert_image, str(file), str(png_path)))
+            elif suffix == '.pdf':
+                first_page, last_page = page_ranges.get(file.name, (1, None))
+                processed_ranges[file.stem] = (first_page, last_page)
+                canonical = {}
+                rewritten = set()
+                jobs = []
+                for page_number, img_index, xref in plan_pdf_images(file, first_page, last_page):
+                    png_path = CONVERTED_DIR / f"{file.stem}_page_{page_number}_image_{img_index}.png"
+                    entries.append({"book": file.stem, "page": page_number, "index": img_index,
+                                    "file": png_path.name, "xref": xref})
+                    if xref not in canonical:
+                        canonical[xref] = png_path
+                        if force or not is_up_to_date(png_path, file):
+                            jobs.append((xref, str(png_path)))
+                            rewritten.add(xref)
+                            pending.add(str(png_path))
+                    elif force or xref in rewritten or not is_up_to_date(png_path, canonical[xref]):
+                        links.append((canonical[xref], png_path))
+                        pending.add(str(png_path))
+                for i in range(0, len(jobs), jobs_per_task):
+                    futures.append(pool.submit(_extract_xrefs, str(file), jobs[i:i + jobs_per_task]))
+            else:
+                print(f"Unsupported file format for {file.name}. Skipping.")
+
+        for future in tqdm(futures, desc="Extracting images"):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error extracting images: {e}")
+                continue
+            if isinstance(result, list):
+                written.update(result)
+
+    # Repeats are linked only after their canonical image has been written
+    for source, target in links:
+        if str(source) in pending and str(source) not in written:
+            continue
+        try:
+            _link_or_copy(source, target)
+            written.add(str(target))
+        except OSError as e:
+            print(f"Error linking {target.name}: {e}")
+
+    def in_processed_range(entry):
+        page_range = processed_ranges.get(entry["book"])
+        if page_range is None:
+            return False
+        first_page, last_page = page_range
+        return first_page <= entry["page"] and (last_page is None or entry["page"] <= last_page)
+
+    # Only placements whose file exists after this run go into the manifest
+    recorded = [e for e in entries if str(CONVERTED_DIR / e["file"]) not in pending or str(CONVERTED_DIR / e["file"]) in written]
+    manifest["images"] = [e for e in manifest["images"] if not in_processed_range(e)] + recorded
+    save_manifest(manifest)
+    print(f"Extracted {len(recorded)} image placements, {len(links)} linked to a repeated xref, "
+          f"{len(entries) - len(recorded)} failed")
+    return manifest
+
 # === Main Function for Upload and Conversion ===
 
 def upload_and_convert():
@@ -104,5 +281,22 @@ def upload_and_convert():
 
 # === Execute the Upload and Conversion Process ===
 
+def parse_page_range(value):
+    first_page, _, last_page = value.partition('-')
+    return int(first_page), int(last_page) if last_page else None
+
 if __name__ == "__main__":
-    upload_and_convert()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract page images from PDFs into converted_images.")
+    parser.add_argument("--headless", action="store_true", help="Skip the file dialog and process files in parallel.")
+    parser.add_argument("files", nargs="*", help="Files to process (default: everything in uploaded_files).")
+    parser.add_argument("--pages", type=parse_page_range, help="Page range for every PDF, e.g. 1-50.")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="Re-extract images that are already up to date.")
+    args = parser.parse_args()
+
+    if args.headless:
+        files = args.files or None
+        page_ranges = {Path(f).name: args.pages for f in (args.files or os.listdir(UPLOAD_DIR))} if args.pages else None
+        extract_images(files, page_ranges=page_ranges, workers=args.workers, force=args.force)
+    else:
+        upload_and_convert()
\ No newline at end of file
@@ -0,0 +1,75 @@
+from dataclasses import dataclass
+
+import fitz  # PyMuPDF
+
+from ocr import iter_ocr_pages
+
+# Pages whose text layer has fewer non-whitespace characters than this are OCRed.
+MIN_TEXT_CHARS = 40
+
+
+@dataclass
+class PageText:
+    """
+    Text of one PDF page and how it was obtained.
+
+    Attributes:
+        page_number (int): 1-based page number.
+        text (str): The page text.
+        method (str): 'text' when read from the PDF text layer, 'ocr' when OCRed.
+    """
+    page_number: int
+    text: str
+    method: str
+
+
+def has_usable_text(text, min_chars=MIN_TEXT_CHARS):
+    """
+    Returns True when a page's text layer is dense enough to skip OCR.
+    """
+    return sum(1 for char in text if not char.isspace()) >= min_chars
+
+
+def extract_pages(pdf_path, first_page=1, last_page=None, min_chars=MIN_TEXT_CHARS, dpi=300, workers=None,
+                  pages_per_task=4):
+    """
+    Extracts the text of every page, using the PDF text layer and OCR only where needed.
+
+    Each page's text layer is read with PyMuPDF first. Pages with no usable text (fewer
+    than `min_chars` non-whitespace characters, e.g. scanned or image-only pages) go
+    through `ocr.iter_ocr_pages`, which renders runs of consecutive pages with a bounded
+    number of tasks in flight. Pages are yielded in order as soon as they are ready.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        first_page (int): First page to extract (1-based, inclusive).
+        last_page (int): Last page to extract (1-based, inclusive). Defaults to the last page.
+        min_chars (int): Minimum non-whitespace characters for the text layer to be used.
+        dpi (int): Rendering resolution for OCRed pages.
+        workers (int): Number of OCR processes. Defaults to the available cores.
+        pages_per_task (int): Consecutive OCR pages rendered per worker task.
+
+    Yields:
+        PageText: One per page in the range, in page order.
+    """
+    pdf_document = fitz.open(pdf_path)
+    last_page = len(pdf_document) if last_page is None else min(last_page, len(pdf_document))
+    texts = {}
+    for page_number in range(first_page, last_page + 1):
+        texts[page_number] = pdf_document.load_page(page_number - 1).get_text("text")
+    pdf_document.close()
+
+    needs_ocr = [page_number for page_number, text in texts.items() if not has_usable_text(text, min_chars)]
+    ocr_pages = iter_ocr_pages(pdf_path, dpi=dpi, pages_per_task=pages_per_task, workers=workers,
+                               page_numbers=needs_ocr)
+    needs_ocr = set(needs_ocr)
+    for page_number in range(first_page, last_page + 1):
+        if page_number in needs_ocr:
+            # OCR results arrive in page order, so the next one is this page
+            _, text = next(ocr_pages)
+            yield PageText(page_number, text, "ocr")
+        else:
+            yield PageText(page_number, texts.pop(page_number), "text")
+
+    print(f"Extracted {pdf_path}: {last_page - first_page + 1 - len(needs_ocr)} pages from text layer, "
+          f"{len(needs_ocr)} OCRed")
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+
+from answer_cache import dump_documents, load_documents
+from index_registry import path_signature
+from lazy_index import CURRENT_NAME, index_files
+
+# A regeneration that has not finished after this long is assumed dead and can be taken over.
+REGENERATION_LEASE_SECONDS = 2 * 3600
+# A regeneration that failed (or left failed answers) is retried after this long.
+REGENERATION_RETRY_SECONDS = 3600
+
+
+@dataclass
+class PrecomputedAnswer:
+    """
+    An answer generated ahead of time for a known question.
+
+    Attributes:
+        question (str): The question, exactly as shown on its button.
+        answer (str): The generated answer text.
+        docs (list): Retrieved pages the answer was generated from.
+        suggested_questions (list): Suggested questions shown with the answer.
+        book (str): Book of the most relevant page, or None.
+        page (int): Number of the most relevant page, or None.
+        image_path (str): Image of the most relevant page, or None when it has none.
+    """
+    question: str
+    answer: str
+    docs: list
+    suggested_questions: list
+    book: str
+    page: int
+    image_path: str
+
+
+# index_dir -> (path_signature, content digest) of the last `directory_digest` call
+_directory_digests = {}
+_directory_digests_lock = threading.Lock()
+
+
+def directory_digest(index_dir):
+    """
+    Returns a digest of the names and contents of the files in an index directory.
+
+    The files are read again only when their `path_signature` changes, and a file
+    rewritten with the same content (the builders rewrite chunk_stats.json and
+    neighbors.json on every run) leaves the digest as it was. The CURRENT file of a
+    versioned index counts as the index and docstore it points to, so a new version
+    with the same content keeps the digest too.
+    """
+    signature = path_signature(index_dir)
+    with _directory_digests_lock:
+        cached = _directory_digests.get(index_dir)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    for name, _, _ in signature or ():
+        if os.path.isfile(index_dir):
+            paths = [index_dir]
+        elif name == CURRENT_NAME:
+            paths = index_files(index_dir)
+        else:
+            paths = [os.path.join(index_dir, name)]
+        digest.update(json.dumps(name).encode("utf-8"))
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+            except FileNotFoundError:
+                # Removed since the signature was taken; the next call sees a new signature
+                continue
+    with _directory_digests_lock:
+        _directory_digests[index_dir] = (signature, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def index_fingerprint(index_dirs):
+    """
+    Returns a digest of the file contents of some index directories.
+
+    Rebuilding any of the indexes with different content changes it, which marks every
+    answer generated from the old indexes as stale. A rebuild that changes nothing
+    keeps it.
+    """
+    digest = hashlib.sha256()
+    for index_dir in index_dirs:
+        digest.update(json.dumps([index_dir, directory_digest(index_dir)]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PrecomputedAnswers:
+    """
+    Answers to known questions (sidebar and suggested questions), stored in SQLite.
+
+    Entries are keyed on the book selection plus the exact question text and are
+    served without any embedding or model call. Each entry records the fingerprint of
+    the indexes it was generated from; entries with another fingerprint are stale and
+    are not served.
+
+    The regenerations table holds one row per fingerprint, so that only one process
+    sharing the file regenerates stale answers (see `claim_regeneration`).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS answers (
+                    selection TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    docs TEXT NOT NULL,
+                    suggested_questions TEXT NOT NULL,
+                    book TEXT,
+                    page INTEGER,
+                    image_path TEXT,
+                    fingerprint TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (selection, question)
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS regenerations (
+                    fingerprint TEXT PRIMARY KEY,
+                    started_at REAL NOT NULL,
+                    finished_at REAL,
+                    succeeded INTEGER
+                )"""
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def lookup(self, selection, question, fingerprint):
+        """
+        Returns the answer stored for exactly `question` and `selection`, or None when
+        there is none or it was generated from other indexes.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                """SELECT question, answer, docs, suggested_questions, book, page, image_path FROM answers
+                   WHERE selection = ? AND question = ? AND fingerprint = ?""",
+                (selection, question.strip(), fingerprint),
+            ).fetchone()
+        if row is None:
+            return None
+        question, answer, docs, suggested, book, page, image_path = row
+        return PrecomputedAnswer(question, answer, load_documents(docs), load_documents(suggested), book, page, image_path)
+
+    def store(self, selection, question, answer, docs, suggested_questions, book, page, image_path, fingerprint):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO answers
+                   (selection, question, answer, docs, suggested_questions, book, page, image_path, fingerprint, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (selection, question.strip(), answer, dump_documents(docs), dump_documents(suggested_questions),
+                 book, page, image_path, fingerprint, time.time()),
+            )
+
+    def has_stale(self, fingerprint):
+        """
+        Returns True when some entry was generated from indexes other than `fingerprint`.
+        """
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM answers WHERE fingerprint != ? LIMIT 1", (fingerprint,)).fetchone() is not None
+
+    def delete_stale(self, fingerprint):
+        """
+        Deletes the entries generated from indexes other than `fingerprint`, and the
+        regeneration records of other fingerprints. Returns the number of entries deleted.
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            deleted = conn.execute("DELETE FROM answers WHERE fingerprint != ?", (fingerprint,)).rowcount
+            conn.execute("DELETE FROM regenerations WHERE fingerprint != ? AND finished_at IS NOT NULL", (fingerprint,))
+        return deleted
+
+    def claim_regeneration(self, fingerprint, lease_seconds=REGENERATION_LEASE_SECONDS,
+                           retry_seconds=REGENERATION_RETRY_SECONDS):
+        """
+        Claims the regeneration of stale answers for `fingerprint`, across processes.
+
+        Returns True for exactly one caller. Everyone else gets False while that run is in
+        progress (until `lease_seconds`), after it succeeded, and for `retry_seconds` after
+        it failed. The caller must report the outcome with `finish_regeneration`.
+        """
+        now = time.time()
+        with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as conn:
+            # IMMEDIATE takes the write lock up front, so two processes cannot both claim
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT started_at, finished_at, succeeded FROM regenerations WHERE fingerprint = ?", (fingerprint,)
+                ).fetchone()
+                if row is not None:
+                    started_at, finished_at, succeeded = row
+                    if finished_at is None and now - started_at < lease_seconds:
+                        conn.execute("ROLLBACK")
+                        return False
+                    if finished_at is not None and (succeeded or now - finished_at < retry_seconds):
+                        conn.execute("ROLLBACK")
+                        return False
+                conn.execute(
+                    "INSERT OR REPLACE INTO regenerations (fingerprint, started_at, finished_at, succeeded) VALUES (?, ?, NULL, NULL)",
+                    (fingerprint, now),
+                )
+                conn.execute("COMMIT")
+                return True
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def finish_regeneration(self, fingerprint, succeeded):
+        """
+        Records the outcome of a regeneration claimed with `claim_regeneration`.
+        """
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE regenerations SET finished_at = ?, succeeded = ? WHERE fingerprint = ?",
+                (time.time(), int(bool(succeeded)), fingerprint),
+            )
+
+    def stats(self, fingerprint):
+        with self._connect() as conn:
+            total, fresh = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(fingerprint = ?), 0) FROM answers", (fingerprint,)
+            ).fetchone()
+        return {"entries": total, "fresh": fresh, "stale": total - fresh}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # Imported here: main imports this module to serve the stored answers
+    from main import precompute_answers
+
+    parser = argparse.ArgumentParser(description="Answer the popular and suggested questions ahead of time.")
+    parser.add_argument("--force", action="store_true", help="Regenerate answers that are still fresh.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rpm", type=float, default=60, help="Chat model requests per minute.")
+    args = parser.parse_args()
+    print(json.dumps(precompute_answers(force=args.force, concurrency=args.concurrency,
+                                        requests_per_minute=args.rpm), indent=1))
@@ -0,0 +1,55 @@
+import json
+import os
+
+import faiss
+import numpy as np
+
+NEIGHBORS_NAME = "neighbors.json"
+DEFAULT_NEIGHBORS = 5
+
+
+def compute_neighbors(questions, vectors, k=DEFAULT_NEIGHBORS, batch_size=1024):
+    """
+    Finds the k nearest other questions of every question in one batched pass.
+
+    All question vectors go into an exact L2 index, the same metric as the questions
+    index, and are searched against it as a matrix (in batches of `batch_size` rows),
+    asking for k + 1 hits so that the question itself can be dropped.
+
+    Args:
+        questions (list): The question texts.
+        vectors (list): One embedding per question.
+        k (int): Neighbors per question.
+        batch_size (int): Query rows per search call.
+
+    Returns:
+        dict: Mapping of question text to its neighbors' texts, nearest first.
+    """
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.IndexFlatL2(matrix.shape[1])
+    index.add(matrix)
+    wanted = min(k + 1, len(questions))
+    neighbors = {}
+    for start in range(0, len(questions), batch_size):
+        _, positions = index.search(matrix[start:start + batch_size], wanted)
+        for row, hits in enumerate(positions, start=start):
+            question = questions[row]
+            others = [questions[p] for p in hits if p != -1 and p != row and questions[p] != question]
+            neighbors[question.strip()] = others[:k]
+    return neighbors
+
+
+def save_neighbors(index_dir, neighbors, k=DEFAULT_NEIGHBORS):
+    path = os.path.join(index_dir, NEIGHBORS_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"k": k, "neighbors": neighbors}, f)
+    os.replace(tmp_path, path)
+
+
+def load_neighbors(path):
+    """
+    Reads a neighbors.json file. Returns the mapping of question text to neighbor texts.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["neighbors"]
@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket for pacing calls to a rate-limited API.
+
+    Tokens are added continuously at `rate` per second, up to `capacity`. `acquire`
+    blocks until enough tokens are available, so short bursts of up to `capacity`
+    calls go through at once while the long-run rate never exceeds `rate`.
+
+    Args:
+        rate (float): Tokens added per second, e.g. requests_per_minute / 60.
+        capacity (float): Maximum number of stored tokens. Defaults to one second's worth, at least 1.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Takes `tokens` if they are available right now. Returns True on success.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until `tokens` are available and takes them.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot acquire {tokens} tokens from a bucket of capacity {self.capacity}")
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return time.monotonic() - started
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
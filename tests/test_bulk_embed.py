@@ -0,0 +1,85 @@
+import pytest
+
+from bulk_embed import BulkEmbedder, RateLimitError, is_rate_limit_error, is_retryable
+
+
+class GoogleGenerativeAIError(Exception):
+    """Same shape as langchain_google_genai's wrapper: the API error is only the cause."""
+
+
+class ServiceUnavailable(Exception):
+    code = 503
+
+
+def wrapped(error, message="Error embedding content"):
+    try:
+        try:
+            raise error
+        except Exception as e:
+            raise GoogleGenerativeAIError(f"{message}: {e}") from e
+    except GoogleGenerativeAIError as outer:
+        return outer
+
+
+def test_wrapped_transient_errors_are_retryable():
+    assert is_retryable(wrapped(ServiceUnavailable("The service is currently unavailable.")))
+    assert is_retryable(wrapped(TimeoutError(), message="Error embedding content"))
+    assert is_retryable(GoogleGenerativeAIError("Error embedding content: 504 Deadline Exceeded"))
+
+
+def test_wrapped_rate_limit_is_detected():
+    error = wrapped(RateLimitError("Resource has been exhausted"))
+    assert is_rate_limit_error(error)
+    assert is_retryable(error)
+
+
+def test_permanent_errors_are_not_retried():
+    assert not is_retryable(wrapped(ValueError("400 Request contains an invalid argument.")))
+    assert not is_rate_limit_error(wrapped(ServiceUnavailable("unavailable")))
+
+
+def test_bulk_embedder_retries_wrapped_503():
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        if len(calls) == 1:
+            raise wrapped(ServiceUnavailable("503 The service is currently unavailable."))
+        return [[float(len(text))] for text in texts]
+
+    embedder = BulkEmbedder(embed, concurrency=1, batch_size=10, backoff_seconds=0.0)
+    assert embedder.embed(["a", "bb", "ccc"]) == [[1.0], [2.0], [3.0]]
+    assert embedder.stats["retries"] == 1
+    assert embedder.stats["rate_limited"] == 0
+
+
+def test_bulk_embedder_raises_permanent_errors_at_once():
+    calls = []
+
+    def embed(texts):
+        calls.append(texts)
+        raise wrapped(ValueError("400 Request contains an invalid argument."))
+
+    embedder = BulkEmbedder(embed, concurrency=1, backoff_seconds=0.0)
+    with pytest.raises(GoogleGenerativeAIError):
+        embedder.embed(["a"])
+    assert len(calls) == 1
+
+
+def test_checkpoint_is_not_reused_across_models(tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return [[float(len(text))] for text in texts]
+
+    BulkEmbedder(embed, concurrency=1, checkpoint_path=checkpoint, model_name="old-model").embed(["a", "bb"])
+    resumed = BulkEmbedder(embed, concurrency=1, checkpoint_path=checkpoint, model_name="old-model")
+    assert resumed.embed(["a", "bb"]) == [[1.0], [2.0]]
+    assert resumed.stats["resumed"] == 2
+
+    other = BulkEmbedder(embed, concurrency=1, checkpoint_path=checkpoint, model_name="new-model")
+    other.embed(["a", "bb"])
+    assert other.stats["resumed"] == 0
+    assert sum(calls) == 4
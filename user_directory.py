@@ -0,0 +1,98 @@
+import csv
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+
+def normalize_email(email):
+    return str(email).strip().lower()
+
+
+def load_emails(path, column="Email"):
+    """
+    Reads the allowed emails from an Excel, CSV or SQLite source.
+
+    Excel and CSV files need an `column` header. SQLite files need a `users` table
+    with an `email` column.
+
+    Args:
+        path (str): Path to a .xlsx/.xls, .csv or .sqlite/.db file.
+        column (str): Name of the email column in Excel and CSV files.
+
+    Returns:
+        frozenset: The normalized email addresses.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".sqlite", ".db"):
+        with sqlite3.connect(path) as conn:
+            values = [row[0] for row in conn.execute("SELECT email FROM users")]
+    elif extension == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            values = [row[column] for row in csv.DictReader(f)]
+    else:
+        values = pd.read_excel(path)[column].dropna().tolist()
+    return frozenset(email for email in (normalize_email(v) for v in values if v is not None) if email)
+
+
+class UserDirectory:
+    """
+    In-memory set of allowed emails, loaded once and refreshed in the background.
+
+    A daemon thread checks the source file's mtime every `refresh_interval` seconds and
+    swaps in a freshly loaded set when it changed, so logins never wait on a file parse.
+
+    Args:
+        path (str): Email source, see `load_emails`.
+        refresh_interval (float): Seconds between mtime checks.
+    """
+
+    def __init__(self, path, refresh_interval=30):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._mtime = os.stat(path).st_mtime_ns
+        self._emails = load_emails(path)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name=f"UserDirectory({path})", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Could not refresh users from {self.path}: {e}")
+
+    def refresh(self):
+        """
+        Reloads the emails if the source file changed since the last load.
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            self._emails = load_emails(self.path)
+            self._mtime = mtime
+            print(f"Reloaded {len(self._emails)} users from {self.path}")
+
+    def contains(self, email):
+        return normalize_email(email) in self._emails
+
+    def __len__(self):
+        return len(self._emails)
+
+    def close(self):
+        self._stop.set()
+
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+
+def get_user_directory(path):
+    """
+    Returns the process-wide UserDirectory for `path`, loading it on first use.
+    """
+    with _directories_lock:
+        if path not in _directories:
+            _directories[path] = UserDirectory(path)
+        return _directories[path]